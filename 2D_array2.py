@@ -1,5 +1,6 @@
 import numpy as np
 import pandas as pd
+from wafer_map import build_wafer_grid
 
 # Read the data from the CSV file
 df = pd.read_csv('https://raw.githubusercontent.com/manhanton/DDE/main/AOI_ATBK_KMI700E_FEB23.csv')
@@ -17,19 +18,8 @@ for lot_id in lot_ids:
         print('Wafer ID:', wafer_id)
         # Select the rows with the specified lot_id and wafer_id
         df_selected = df[(df['lot_id'] == lot_id) & (df['wafer_id'] == wafer_id)]
-        # Get the maximum values of die_x and die_y
-        x_max = df_selected['die_x'].max()
-        y_max = df_selected['die_y'].max()
-        # Create a numpy array of zeros to represent the grid
-        grid = np.zeros((y_max+1, x_max+1))
-        # Fill in the grid with the values from pass_fail_flag
-        for i, row in df_selected.iterrows():
-            x = row['die_x']
-            y = row['die_y']
-            if row['pass_fail_flag'] == 'P':
-                grid[y, x] = 0
-            else:
-                grid[y, x] = 1
+        # Build the grid of pass_fail_flag values
+        grid = build_wafer_grid(df_selected)
         # Print the grid with the values
         for row in grid[::-1]:
             for val in row:
@@ -0,0 +1,150 @@
+import glob
+import os
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from aoi_loader import read_aoi_csv
+from aoi_store import WaferStore
+from defect_cube import DefectCube
+
+# Spark part files, as written into a drop directory (or its per-shift subdirectories)
+PART_PATTERNS = ['part-*.csv', os.path.join('*', 'part-*.csv')]
+
+# Everything a callback reads, swapped in as a whole
+Snapshot = namedtuple('Snapshot', ['store', 'cube', 'version', 'files', 'rows', 'wafers'])
+
+
+# First and last test time of every tested wafer, from all of its rows (before any row_filter)
+def tested_wafers(df, current=None):
+    frames = [] if current is None else [current]
+    if df is not None and len(df):
+        frames.append(df.groupby(['lot_id', 'wafer_id'], observed=True)['test_date_time']
+                      .agg(first_test='min', last_test='max').reset_index())
+    if not frames:
+        return pd.DataFrame({'lot_id': [], 'wafer_id': [], 'first_test': pd.Series(dtype='datetime64[ns]'),
+                             'last_test': pd.Series(dtype='datetime64[ns]')})
+    if len(frames) == 1:
+        return frames[0]
+    # A wafer found again in new files keeps one row spanning all its tests
+    wafers = pd.concat(frames, ignore_index=True).astype({'lot_id': object, 'wafer_id': object})
+    return wafers.groupby(['lot_id', 'wafer_id'], sort=False).agg(
+        first_test=('first_test', 'min'), last_test=('last_test', 'max')).reset_index()
+
+
+# AOI data that grows while the dashboard runs
+class LiveAOI:
+    """Holds the current Snapshot of the AOI data and builds the next one on ingest.
+
+    Ingesting copies the indexes of the current WaferStore and DefectCube (their row
+    chunks and bucket aggregates are shared), appends only the new rows to the copies
+    and then replaces `snapshot` in a single assignment. A callback that reads
+    `live.snapshot` once therefore sees one consistent store/cube pair, however many
+    files arrive while it runs, and an ingest costs as much as the new rows.
+    `row_filter` is applied to every new frame, e.g. to keep only failing dies;
+    `snapshot.wafers` still lists every tested wafer, so rates can count the wafers
+    the filter dropped all rows of.
+    """
+
+    def __init__(self, df=None, row_filter=None):
+        self.row_filter = row_filter
+        self.lock = threading.Lock()
+        wafers = tested_wafers(df)
+        if df is not None and row_filter is not None:
+            df = row_filter(df)
+        store, cube = WaferStore(df), DefectCube(df)
+        self.snapshot = Snapshot(store, cube, 0, frozenset(), 0 if df is None else len(df), wafers)
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    # Append new rows and publish them as the next snapshot; returns the number of rows kept
+    def append(self, df, files=()):
+        with self.lock:
+            current = self.snapshot
+            wafers = tested_wafers(df, current.wafers)
+            if self.row_filter is not None:
+                df = self.row_filter(df)
+            store, cube = current.store, current.cube
+            if len(df):
+                store, cube = store.copy(), cube.copy()
+                store.append(df)
+                cube.append(df)
+            self.snapshot = Snapshot(store, cube, current.version + 1, current.files | frozenset(files),
+                                     current.rows + len(df), wafers)
+        return len(df)
+
+    # Parse the given part files and publish them together
+    def ingest(self, paths):
+        paths = [path for path in paths if path not in self.snapshot.files]
+        if not paths:
+            return 0
+        frames = [read_aoi_csv(path) for path in paths]
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        return self.append(df, paths)
+
+
+# Part files under a drop directory, oldest first
+def find_part_files(directory):
+    paths = {path for pattern in PART_PATTERNS for path in glob.glob(os.path.join(directory, pattern))}
+    return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+
+# Background thread that ingests new part files from a drop directory
+class DropDirectoryWatcher(threading.Thread):
+    """Polls `directory` every `interval` seconds for part files not ingested yet.
+
+    A file is only read once its size has not changed between two polls, so files
+    that are still being copied in are picked up on the next round. Files already
+    present when the watcher starts are ingested on its first rounds too, unless
+    they were passed in `skip` (e.g. the export the dashboard started from).
+    """
+
+    def __init__(self, live, directory, interval=2.0, skip=()):
+        super().__init__(daemon=True, name='aoi-drop-watcher')
+        self.live = live
+        self.directory = directory
+        self.interval = interval
+        self.skip = {os.path.abspath(path) for path in skip}
+        self.sizes = {}
+        self.stopped = threading.Event()
+        self.errors = {}
+
+    def poll(self):
+        ready = []
+        for path in find_part_files(self.directory):
+            if os.path.abspath(path) in self.skip or path in self.live.snapshot.files or path in self.errors:
+                continue
+            size = os.path.getsize(path)
+            if self.sizes.get(path) == size:
+                ready.append(path)
+            self.sizes[path] = size
+        if not ready:
+            return 0
+        start = time.perf_counter()
+        try:
+            rows = self.live.ingest(ready)
+        except (OSError, ValueError, pd.errors.ParserError):
+            # Ingest the good files on their own and remember the broken ones
+            rows = 0
+            for path in ready:
+                try:
+                    rows += self.live.ingest([path])
+                except (OSError, ValueError, pd.errors.ParserError) as file_error:
+                    self.errors[path] = str(file_error)
+                    print(f'skipping {path}: {file_error}')
+        for path in ready:
+            self.sizes.pop(path, None)
+        print(f'ingested {len(ready)} files, {rows} rows in {time.perf_counter() - start:.2f} s '
+              f'(data version {self.live.version})')
+        return rows
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.poll()
+
+    def stop(self):
+        self.stopped.set()
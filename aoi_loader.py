@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# The Spark export read by the dashboards
+AOI_CSV = 'part-00000-5eaa3dcb-db9b-49f4-baac-602e5f9baaa8-c000.csv'
+
+# Columns the dashboards use, and how each one is stored in the cache
+AOI_COLUMNS = ['lot_id', 'wafer_id', 'die_x', 'die_y', 'pass_fail_flag', 'description', 'test_date_time', 'tester_id']
+CATEGORY_COLUMNS = ['lot_id', 'wafer_id', 'pass_fail_flag', 'description', 'tester_id']
+COORDINATE_COLUMNS = ['die_x', 'die_y']
+
+
+# Path of the columnar cache kept next to a CSV export
+def cache_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '.arrow'
+
+
+# Parse the CSV export once into the compact column types
+def read_aoi_csv(csv_path):
+    df = pd.read_csv(csv_path, usecols=AOI_COLUMNS)
+    # Same string conversion the dashboards did, so NaN descriptions stay as 'nan'
+    df['description'] = df['description'].astype(str)
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype('category')
+    # Die coordinates are rounded to int16; missing coordinates stay missing
+    for col in COORDINATE_COLUMNS:
+        df[col] = df[col].round().astype('Int16')
+    df['test_date_time'] = pd.to_datetime(df['test_date_time'])
+    return df
+
+
+# Write the parsed frame as an uncompressed Arrow file, which reads back without decoding
+def write_aoi_cache(df, cache_path):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # A temporary file of our own, so processes building the cache at once do not write
+    # over each other; the last one to finish replaces the cache
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_path)),
+                                    prefix=os.path.basename(cache_path) + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+# Read the Arrow cache through a memory map and copy it into a DataFrame
+def read_aoi_cache(cache_path, columns=None):
+    with pa.memory_map(cache_path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas(types_mapper={pa.int16(): pd.Int16Dtype()}.get)
+
+
+# Load the AOI data, converting the CSV to the cache only when the cache is missing or stale
+def load_aoi(csv_path=AOI_CSV, cache_path=None, columns=None, rebuild=False):
+    """Return the AOI rows with categorical ID/description columns, Int16 die
+    coordinates and datetime64 test_date_time.
+
+    The first call parses the CSV and writes `<csv>.arrow`; later calls read that file
+    instead and skip CSV parsing. The file is read through a memory map but copied
+    into the returned pandas frame, so every process holds its own copy. The cache is
+    rebuilt when the CSV is newer.
+    """
+    if cache_path is None:
+        cache_path = cache_path_for(csv_path)
+    stale = (not os.path.exists(cache_path)
+             or (os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(cache_path)))
+    if rebuild or stale:
+        df = read_aoi_csv(csv_path)
+        write_aoi_cache(df, cache_path)
+        return df if columns is None else df[columns]
+    return read_aoi_cache(cache_path, columns)
@@ -0,0 +1,102 @@
+import copy
+
+import pandas as pd
+
+
+# Row store for the AOI data, indexed by (lot_id, wafer_id)
+class WaferStore:
+    """Keeps the AOI rows grouped by lot and wafer so callbacks can fetch one wafer
+    without scanning the whole table.
+
+    Every appended frame is sorted once by (lot_id, wafer_id) and kept as a chunk;
+    `offsets` maps each (lot_id, wafer_id) to the contiguous row slices holding it.
+    Appending only indexes the new rows, and `compact` merges the chunks back into a
+    single sorted frame when there are too many of them.
+    """
+
+    def __init__(self, df=None, max_chunks=16):
+        self.max_chunks = max_chunks
+        self.chunks = []
+        # (lot_id, wafer_id) -> list of (chunk number, start row, stop row)
+        self.offsets = {}
+        # lot_id -> wafer_ids in order of first appearance (dicts keep insertion order)
+        self.lot_wafers = {}
+        self.failing_wafers = {}
+        # Bumped on every change so caches can tell the data has moved on
+        self.version = 0
+        if df is not None:
+            self.append(df)
+
+    # Index a new frame of rows without touching the rows already stored
+    def append(self, df):
+        if len(df) == 0:
+            return
+        self._index_order(df)
+        chunk = df.sort_values(['lot_id', 'wafer_id'], kind='stable').reset_index(drop=True)
+        self._index_chunk(len(self.chunks), chunk)
+        self.chunks.append(chunk)
+        self.version += 1
+        if len(self.chunks) > self.max_chunks:
+            self.compact()
+
+    # A copy that can be appended to without changing this store; the row chunks are
+    # shared, only the indexes are copied (cost in wafers, not rows)
+    def copy(self):
+        other = copy.copy(self)
+        other.chunks = list(self.chunks)
+        other.offsets = {key: list(slices) for key, slices in self.offsets.items()}
+        other.lot_wafers = {lot: dict(wafers) for lot, wafers in self.lot_wafers.items()}
+        other.failing_wafers = {lot: dict(wafers) for lot, wafers in self.failing_wafers.items()}
+        return other
+
+    # Merge all chunks into one sorted frame and rebuild the offsets from it
+    def compact(self):
+        if len(self.chunks) <= 1:
+            return
+        categorical = [col for col in self.chunks[0] if isinstance(self.chunks[0][col].dtype, pd.CategoricalDtype)]
+        chunk = pd.concat(self.chunks, ignore_index=True)
+        # Chunks read from different files have different categories, which concat turns into object
+        for col in categorical:
+            if not isinstance(chunk[col].dtype, pd.CategoricalDtype):
+                chunk[col] = chunk[col].astype('category')
+        chunk = chunk.sort_values(['lot_id', 'wafer_id'], kind='stable').reset_index(drop=True)
+        self.chunks = []
+        self.offsets = {}
+        self._index_chunk(0, chunk)
+        self.chunks.append(chunk)
+
+    # Return the lot_ids in order of first appearance
+    def lot_ids(self):
+        return list(self.lot_wafers)
+
+    # Return the wafer_ids of a lot, optionally only those with an 'F' die
+    def wafer_ids(self, lot_id, failing_only=False):
+        wafers = self.failing_wafers if failing_only else self.lot_wafers
+        return list(wafers.get(lot_id, {}))
+
+    # Return the rows of one wafer
+    def rows(self, lot_id, wafer_id):
+        pieces = [self.chunks[c].iloc[start:stop] for c, start, stop in self.offsets.get((lot_id, wafer_id), [])]
+        if not pieces:
+            return self.chunks[0].iloc[0:0] if self.chunks else pd.DataFrame()
+        if len(pieces) == 1:
+            return pieces[0]
+        return pd.concat(pieces, ignore_index=True)
+
+    # Return every stored row as one frame
+    def frame(self):
+        self.compact()
+        return self.chunks[0] if self.chunks else pd.DataFrame()
+
+    def _index_order(self, df):
+        for lot_id, wafer_id in df[['lot_id', 'wafer_id']].drop_duplicates().itertuples(index=False):
+            self.lot_wafers.setdefault(lot_id, {})[wafer_id] = None
+        failing = df.loc[df['pass_fail_flag'] == 'F', ['lot_id', 'wafer_id']].drop_duplicates()
+        for lot_id, wafer_id in failing.itertuples(index=False):
+            self.failing_wafers.setdefault(lot_id, {})[wafer_id] = None
+
+    def _index_chunk(self, number, chunk):
+        # The chunk is sorted, so the rows of every wafer are contiguous
+        groups = chunk.groupby(['lot_id', 'wafer_id'], sort=False, dropna=False, observed=True).indices
+        for key, positions in groups.items():
+            self.offsets.setdefault(key, []).append((number, positions[0], positions[-1] + 1))
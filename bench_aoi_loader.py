@@ -0,0 +1,73 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from aoi_loader import AOI_CSV, cache_path_for
+from synthetic_data import write_aoi_csv
+
+# Run inside a fresh interpreter so every measurement starts from an empty process
+LEGACY_LOAD = """
+import pandas as pd
+df = pd.read_csv({path!r})
+df['test_date_time'] = pd.to_datetime(df['test_date_time'])
+df['description'] = df['description'].astype(str)
+"""
+
+CACHED_LOAD = """
+from aoi_loader import load_aoi
+df = load_aoi({path!r})
+"""
+
+# ru_maxrss survives fork/exec from this (already large) process, so prefer VmHWM on Linux
+REPORT = """
+import resource, time
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if os.path.exists('/proc/self/status'):
+    with open('/proc/self/status') as status:
+        peak_kb = next(int(line.split()[1]) for line in status if line.startswith('VmHWM'))
+print(time.perf_counter() - start, peak_kb)
+"""
+
+
+def measure(code, path):
+    script = 'import os, time\nstart = time.perf_counter()\n' + code.format(path=path) + REPORT
+    out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+    seconds, max_rss_kb = float(out[-2]), int(out[-1])
+    return seconds, max_rss_kb / 1024
+
+
+# Time the CSV read and both cached loads of one export, each in a fresh interpreter
+def compare_loads(path):
+    print(f'{path}: {os.path.getsize(path) / 2**20:.1f} MB')
+
+    cache = cache_path_for(path)
+    if os.path.exists(cache):
+        os.remove(cache)
+    for name, code in [('read_csv (before)', LEGACY_LOAD), ('load_aoi, first run', CACHED_LOAD), ('load_aoi, cached', CACHED_LOAD)]:
+        seconds, rss = measure(code, path)
+        print(f'{name:<22} {seconds:7.2f} s  max RSS {rss:8.1f} MB')
+    print(f'cache size: {os.path.getsize(cache) / 2**20:.1f} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare CSV startup with the columnar AOI cache')
+    parser.add_argument('csv', nargs='?', default=AOI_CSV)
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.csv)
+    if os.path.exists(path):
+        compare_loads(path)
+        return
+    # Synthetic export and its cache, removed after the comparison
+    with tempfile.TemporaryDirectory(prefix='aoi-synthetic-') as directory:
+        path = os.path.join(directory, 'aoi_synthetic.csv')
+        write_aoi_csv(path)
+        print(f'{args.csv} not found, using synthetic data in {path}')
+        compare_loads(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+import numpy as np
+
+from synthetic_data import make_aoi_frame, make_developer_names, make_taxi_month, make_taxi_zones
+
+# Data sizes of the synthetic inputs: AOI lots x wafers x dies across, taxi rows, developer names
+SCALES = {
+    'small': {'aoi': (5, 25, 40), 'taxi_rows': 50000, 'names': 1000},
+    'medium': {'aoi': (20, 25, 60), 'taxi_rows': 200000, 'names': 5000},
+    'large': {'aoi': (100, 25, 80), 'taxi_rows': 1000000, 'names': 20000},
+}
+# One line per run: commit, machine, scale and the timings of every benchmark
+RESULTS_FILE = 'bench_results.jsonl'
+
+# name -> setup(data) returning the function to time
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+# Synthetic inputs of a scale, built once and shared by the benchmarks
+class BenchData:
+    def __init__(self, scale, seed=0):
+        self.scale = SCALES[scale]
+        self.seed = seed
+        self.cache = {}
+
+    def get(self, name, build):
+        if name not in self.cache:
+            self.cache[name] = build()
+        return self.cache[name]
+
+    # AOI rows after the columnar load (categorical IDs, Int16 coordinates)
+    def aoi(self):
+        def build():
+            from aoi_loader import CATEGORY_COLUMNS, COORDINATE_COLUMNS
+            df = make_aoi_frame(*self.scale['aoi'], seed=self.seed)
+            df = df.drop(columns=['operator', 'recipe'])
+            for col in CATEGORY_COLUMNS:
+                df[col] = df[col].astype('category')
+            for col in COORDINATE_COLUMNS:
+                df[col] = df[col].round().astype('Int16')
+            return df
+        return self.get('aoi', build)
+
+    # The failing rows the dashboards keep
+    def aoi_failures(self):
+        return self.get('aoi_failures', lambda: self.aoi()[self.aoi()['pass_fail_flag'] == 'F'].reset_index(drop=True))
+
+    # Random date ranges within the AOI month, the same on every run
+    def date_ranges(self, count=20):
+        def build():
+            rng = np.random.default_rng(self.seed)
+            first = self.aoi()['test_date_time'].min().normalize()
+            starts = first + np.timedelta64(1, 'D') * rng.integers(0, 27, count)
+            return [(str(start), str(start + np.timedelta64(1, 'D') * int(days)))
+                    for start, days in zip(starts, rng.integers(1, 8, count))]
+        return self.get('date_ranges', build)
+
+    def taxi(self):
+        def build():
+            from taxi_pipeline import TRIP_DTYPES
+            return make_taxi_month(self.scale['taxi_rows'], seed=self.seed).astype(TRIP_DTYPES)
+        return self.get('taxi', build)
+
+    def names(self):
+        return self.get('names', lambda: make_developer_names(self.scale['names'], seed=self.seed))
+
+
+# update_output_div: fetch one wafer's rows from the store and build its die grid
+@benchmark('wafer_grid')
+def bench_wafer_grid(data):
+    from aoi_store import WaferStore
+    from wafer_map import build_wafer_grid
+    store = WaferStore(data.aoi_failures())
+    keys = [(lot, wafer) for lot in store.lot_ids() for wafer in store.wafer_ids(lot)][:50]
+
+    def run():
+        for lot_id, wafer_id in keys:
+            build_wafer_grid(store.rows(lot_id, wafer_id), dtype=np.uint8)
+    return run
+
+
+# The same wafers decoded from the bit-packed wafer records
+@benchmark('wafer_records_grid')
+def bench_wafer_records_grid(data):
+    from wafer_records import WaferRecords
+    records = WaferRecords.from_frame(data.aoi())
+    keys = [(lot, wafer) for lot in records.lot_ids() for wafer in records.wafer_ids(lot)][:50]
+
+    def run():
+        for lot_id, wafer_id in keys:
+            records.grid(lot_id, wafer_id)
+    return run
+
+
+# update_output_div: heatmap figure of a large wafer grid
+@benchmark('wafer_figure')
+def bench_wafer_figure(data):
+    from figure_render import wafer_heatmap_figure
+    grid = (np.random.default_rng(data.seed).random((600, 600)) < 0.05).astype(np.uint8)
+    return lambda: wafer_heatmap_figure(grid).to_json()
+
+
+# update_stacked_bar: per-lot description counts of a date range and the stacked bar figure
+@benchmark('stacked_bar')
+def bench_stacked_bar(data):
+    from defect_cube import DefectCube
+    from figure_render import stacked_bar_figure
+    cube = DefectCube(data.aoi_failures())
+    ranges = data.date_ranges()
+
+    def run():
+        for start_date, end_date in ranges:
+            stacked_bar_figure(cube.counts(start_date, end_date, ['lot_id', 'description']))
+    return run
+
+
+# update_pareto_chart: distinct lots per description of a date range
+@benchmark('pareto')
+def bench_pareto(data):
+    from defect_cube import DefectCube
+    cube = DefectCube(data.aoi_failures())
+    ranges = data.date_ranges()
+
+    def run():
+        for start_date, end_date in ranges:
+            cube.distinct_lots(start_date, end_date)
+    return run
+
+
+# Spatial pattern analysis of all wafers
+@benchmark('defect_patterns')
+def bench_defect_patterns(data):
+    from defect_patterns import analyze_patterns
+    df = data.aoi()
+    # A date range without rows gives an empty report, with the same columns
+    empty = analyze_patterns(df.iloc[:0])
+    assert empty.wafers.empty and empty.lots == []
+    assert list(empty.wafers.columns) == list(analyze_patterns(df.head(1000)).wafers.columns)
+    return lambda: analyze_patterns(df)
+
+
+# dev_name_thai.calculate_similarity over the developer name list
+@benchmark('calculate_similarity')
+def bench_calculate_similarity(data):
+    from dev_name_thai import calculate_similarity
+    names = data.names()
+    return lambda: calculate_similarity(names)
+
+
+# The taxi cleaning stages of one chunk
+@benchmark('taxi_pipeline')
+def bench_taxi_pipeline(data):
+    from taxi_pipeline import default_stages, run_pipeline
+    trips = data.taxi()
+    stages = default_stages(make_taxi_zones())
+    return lambda: list(run_pipeline([trips.copy()], stages))
+
+
+@benchmark('taxi_timestamps')
+def bench_taxi_timestamps(data):
+    from taxi_pipeline import process_timestamps
+    trips = data.taxi()
+    return lambda: process_timestamps(trips.copy())
+
+
+# Time `func` `repeat` times after one warm-up call
+def time_function(func, repeat=5):
+    func()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return {'min': min(seconds), 'median': statistics.median(seconds), 'repeat': repeat}
+
+
+def run_suite(names, scale='small', repeat=5, seed=0):
+    data = BenchData(scale, seed)
+    results = {}
+    for name in names:
+        func = BENCHMARKS[name](data)
+        results[name] = time_function(func, repeat)
+        print(f"{name:<22} min {results[name]['min'] * 1000:9.2f} ms  median {results[name]['median'] * 1000:9.2f} ms",
+              flush=True)
+    return results
+
+
+# Commit of the working tree, marked dirty when there are uncommitted changes
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Benchmarks at least `tolerance` times slower (by their minimum) than in the latest earlier
+# run of another commit on the same machine and scale
+def find_regressions(run, history, tolerance=1.2):
+    earlier = [entry for entry in history if entry['machine'] == run['machine'] and entry['scale'] == run['scale']
+               and entry['commit'] != run['commit']]
+    if not earlier:
+        return None, []
+    baseline = earlier[-1]
+    regressions = []
+    for name, result in run['results'].items():
+        before = baseline['results'].get(name)
+        if before and result['min'] > tolerance * before['min']:
+            regressions.append((name, before['min'], result['min']))
+    return baseline, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the hot paths on synthetic data and track them across commits')
+    parser.add_argument('benchmarks', nargs='*', help=f'default: all of {", ".join(BENCHMARKS)}')
+    parser.add_argument('--scale', choices=list(SCALES), default='small')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--results', default=RESULTS_FILE, help='JSON lines history the run is appended to')
+    parser.add_argument('--tolerance', type=float, default=1.2, help='slowdown reported as a regression')
+    parser.add_argument('--no-save', action='store_true', help='only compare, do not append to the history')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 on a regression')
+    args = parser.parse_args()
+
+    names = args.benchmarks or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(unknown)}')
+    results = run_suite(names, args.scale, args.repeat)
+    run = {'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'machine': platform.node(),
+           'python': platform.python_version(), 'scale': args.scale, 'results': results}
+
+    baseline, regressions = find_regressions(run, load_history(args.results), args.tolerance)
+    if baseline is not None:
+        print(f"compared with {baseline['commit']} ({baseline['time']})")
+        for name, before, after in regressions:
+            print(f'REGRESSION {name}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms ({after / before:.2f}x)')
+        if not regressions:
+            print(f'no benchmark slower than {args.tolerance}x')
+    if not args.no_save:
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(run) + '\n')
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from synthetic_data import make_taxi_month
+from taxi_pipeline import process_timestamps
+
+
+# process_timestamps of Data_prep_yellow_2018.ipynb followed by the hour/rush-hour cell of
+# Data_model_ML.ipynb (round-tripped through strings, as the model notebook reads the prep CSV)
+def legacy_time_features(df):
+    pu_time = pd.to_datetime(df['tpep_pickup_datetime'])
+    do_time = pd.to_datetime(df['tpep_dropoff_datetime'])
+    trip_duration = (do_time - pu_time) / np.timedelta64(1, 's')
+    df = df.copy()
+    df['PU_datetime'] = pu_time
+    df['DO_datetime'] = do_time
+    df['trip_duration'] = trip_duration
+    df['PU_weekday'] = pu_time.dt.day_name()
+    df['DO_weekday'] = do_time.dt.day_name()
+    df.drop(columns=['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'store_and_fwd_flag'], inplace=True)
+
+    df['PU_datetime'] = pd.to_datetime(df['PU_datetime'].astype(str).str.strip(), format='%Y-%m-%d %H:%M:%S')
+    df['DO_datetime'] = pd.to_datetime(df['DO_datetime'].astype(str).str.strip(), format='%Y-%m-%d %H:%M:%S')
+    df['PU_hour'] = df['PU_datetime'].apply(lambda x: x.hour)
+    df['DO_hour'] = df['DO_datetime'].apply(lambda x: x.hour)
+    list_time = [16, 17, 18, 19, 20]
+    df['rush_hour'] = pd.Series(np.where((df.PU_hour.isin(list_time)) & (df.DO_hour.isin(list_time)), 1, 0), df.index)
+    return df
+
+
+def timed(func, df):
+    start = time.perf_counter()
+    result = func(df)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the apply-based time features with process_timestamps')
+    # January 2018 had about 8.76 million yellow taxi trips
+    parser.add_argument('--rows', type=int, default=8760000)
+    parser.add_argument('--month', default='2018-01')
+    args = parser.parse_args()
+
+    trips = make_taxi_month(args.rows, args.month)
+    legacy, legacy_seconds = timed(legacy_time_features, trips)
+    fast, fast_seconds = timed(process_timestamps, trips)
+
+    # Both versions must agree on every feature
+    for col in ['trip_duration', 'PU_hour', 'DO_hour', 'rush_hour']:
+        assert np.array_equal(legacy[col].to_numpy(dtype=float), fast[col].to_numpy(dtype=float)), col
+    for col in ['PU_weekday', 'DO_weekday']:
+        assert np.array_equal(legacy[col].to_numpy(dtype=object), fast[col].to_numpy(dtype=object)), col
+    print(f'{len(trips)} trips  apply {legacy_seconds:7.2f} s  vectorized {fast_seconds:6.2f} s  '
+          f'speedup {legacy_seconds / fast_seconds:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
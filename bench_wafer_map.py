@@ -0,0 +1,68 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from wafer_map import build_wafer_grid
+
+
+# Make one round wafer with the given number of dies across, with a few NaN coordinates
+def make_wafer(dies_across, fail_rate=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    r = dies_across / 2
+    yy, xx = np.mgrid[0:dies_across, 0:dies_across]
+    inside = (xx - r + 0.5) ** 2 + (yy - r + 0.5) ** 2 <= r ** 2
+    df = pd.DataFrame({'die_x': xx[inside].astype(float), 'die_y': yy[inside].astype(float)})
+    df['pass_fail_flag'] = np.where(rng.random(len(df)) < fail_rate, 'F', 'P')
+    df.loc[df.sample(frac=0.001, random_state=seed).index, ['die_x', 'die_y']] = np.nan
+    return df
+
+
+# The grid fill that update_output_div used before build_wafer_grid
+def legacy_wafer_grid(df_selected):
+    df_selected = df_selected.copy()
+    if df_selected['die_x'].isna().any():
+        df_selected.loc[df_selected['die_x'].isna(), 'die_x'] = 0
+    if df_selected['die_y'].isna().any():
+        df_selected.loc[df_selected['die_y'].isna(), 'die_y'] = 0
+    x_max = round(df_selected['die_x'].max())
+    y_max = round(df_selected['die_y'].max())
+    grid = np.zeros((y_max+1, x_max+1), dtype=int)
+    for i, row in df_selected.iterrows():
+        x = int(round(row['die_x']))
+        y = int(round(row['die_y']))
+        if row['pass_fail_flag'] == 'P':
+            grid[y, x] = 0
+        else:
+            grid[y, x] = 1
+    return grid
+
+
+def best_time(func, df, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the iterrows wafer grid with build_wafer_grid')
+    parser.add_argument('--dies-across', type=int, nargs='+', default=[50, 100, 200])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for dies_across in args.dies_across:
+        df = make_wafer(dies_across)
+        # Both builders must produce the same grid
+        assert np.array_equal(legacy_wafer_grid(df), build_wafer_grid(df))
+        legacy = best_time(legacy_wafer_grid, df, args.repeat)
+        vectorized = best_time(build_wafer_grid, df, args.repeat)
+        print(f'{len(df):>7} dies  iterrows {legacy*1000:9.1f} ms  '
+              f'numpy {vectorized*1000:7.2f} ms  speedup {legacy/vectorized:7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+import contextlib
+import cProfile
+import functools
+import heapq
+import io
+import itertools
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from flask import Response, request
+
+# Dash posts every callback to this endpoint
+DASH_UPDATE_PATH = '_dash-update-component'
+QUANTILES = [0.5, 0.95, 0.99]
+# Share of the requests split into stages / run under cProfile, unless given to CallbackMetrics
+SAMPLE_RATE = float(os.environ.get('CALLBACK_METRICS_SAMPLE', '0'))
+PROFILE_RATE = float(os.environ.get('CALLBACK_PROFILE', '0'))
+
+
+# Timing record of one callback request
+class CallbackTiming:
+    def __init__(self, sampled):
+        self.name = None
+        self.sampled = sampled
+        self.start = time.perf_counter()
+        self.callback_seconds = None
+        self.serialize_seconds = None
+        self.stages = {}
+        self.rows = 0
+        self.profiler = None
+
+
+# Latency of the Dash callbacks of an app, split into stages, with rolling percentiles
+class CallbackMetrics:
+    """Times every callback request of a Dash app.
+
+    `install(app)` hooks the Flask requests of the callbacks: the whole request time
+    and the size of the JSON response are recorded for every request. Callbacks
+    decorated with `timed()` also get their own run time, and the rest of the request
+    (Dash encoding the result plus the Flask/Dash dispatch) as `overhead`. For the
+    requests the `payload_meter` samples, the figures returned are encoded once more
+    to time that encoding (`serialize`), and `dispatch` is the overhead without it.
+    Inside a callback, `with metrics.stage('filter'):` and `metrics.add_rows(n)` record
+    stage times and scanned rows, but only for the `sample_rate` share of the requests;
+    the rest only pay for checking a thread-local. Every series keeps its last
+    `window` values, from which /metrics reports p50/p95/p99.
+
+    With `profile_rate` > 0 that share of the requests runs under cProfile, and the
+    `profile_keep` slowest profiles are kept for /metrics/profiles.
+    """
+
+    def __init__(self, window=2048, sample_rate=None, profile_rate=None, profile_keep=5, payload_meter=None):
+        self.window = window
+        self.payload_meter = payload_meter
+        self.sample_rate = SAMPLE_RATE if sample_rate is None else sample_rate
+        self.profile_rate = PROFILE_RATE if profile_rate is None else profile_rate
+        self.profile_keep = profile_keep
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # (callback, series) -> recent values, plus running count and sum
+        self.series = {}
+        self.counts = {}
+        self.sums = {}
+        # Heap of (seconds, n, callback, report) of the slowest profiled requests
+        self.profiles = []
+        self.profile_numbers = itertools.count()
+
+    # Hook the callback requests of `app` and add the /metrics and /metrics/profiles routes
+    def install(self, app):
+        server = app.server
+        server.before_request(self._before_request)
+        server.after_request(self._after_request)
+        server.teardown_request(self._teardown_request)
+        server.add_url_rule('/metrics', 'callback_metrics', self.metrics_view)
+        server.add_url_rule('/metrics/profiles', 'callback_profiles', self.profiles_view)
+        return app
+
+    # Decorator for a callback, placed below @app.callback
+    def timed(self, name=None):
+        def decorator(func):
+            callback_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args):
+                timing = getattr(self.local, 'timing', None)
+                if timing is None:
+                    return func(*args)
+                timing.name = callback_name
+                start = time.perf_counter()
+                try:
+                    result = func(*args)
+                finally:
+                    timing.callback_seconds = time.perf_counter() - start
+                meter = self.payload_meter
+                if meter is not None and (timing.sampled or random.random() < meter.sample_rate):
+                    timing.serialize_seconds = meter.record(callback_name, result)
+                return result
+            return wrapper
+        return decorator
+
+    # Time a stage of the current callback (data filter, aggregation, figure build, ...)
+    def stage(self, name):
+        timing = getattr(self.local, 'timing', None)
+        if timing is None or not timing.sampled:
+            return contextlib.nullcontext()
+        return self._stage(timing, name)
+
+    @contextlib.contextmanager
+    def _stage(self, timing, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing.stages[name] = timing.stages.get(name, 0.0) + time.perf_counter() - start
+
+    # Count rows scanned by the current callback
+    def add_rows(self, rows):
+        timing = getattr(self.local, 'timing', None)
+        if timing is not None and timing.sampled:
+            timing.rows += int(rows)
+
+    def observe(self, callback, series, value):
+        key = (callback, series)
+        with self.lock:
+            values = self.series.get(key)
+            if values is None:
+                values = self.series[key] = deque(maxlen=self.window)
+            values.append(value)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.sums[key] = self.sums.get(key, 0) + value
+
+    # count, sum and the QUANTILES of the recent values of every (callback, series)
+    def summary(self):
+        with self.lock:
+            snapshot = {key: np.array(values) for key, values in self.series.items()}
+            counts, sums = dict(self.counts), dict(self.sums)
+        result = {}
+        for (callback, series), values in sorted(snapshot.items()):
+            quantiles = np.quantile(values, QUANTILES) if len(values) else [0.0] * len(QUANTILES)
+            result.setdefault(callback, {})[series] = {
+                'count': counts[(callback, series)], 'sum': sums[(callback, series)],
+                **{f'p{round(q * 100)}': float(v) for q, v in zip(QUANTILES, quantiles)}}
+        return result
+
+    # /metrics: Prometheus text format, or JSON with ?format=json
+    def metrics_view(self):
+        summary = self.summary()
+        if request.args.get('format') == 'json':
+            return summary
+        lines = []
+        for kind, unit in [('seconds', 'seconds'), ('bytes', 'bytes'), ('rows', 'rows')]:
+            metric = f'dash_callback_{unit}'
+            lines.append(f'# TYPE {metric} summary')
+            for callback, series in summary.items():
+                for name, stats in series.items():
+                    # Series are named '<stage>_seconds', 'response_bytes' and 'scanned_rows'
+                    if not name.endswith(kind):
+                        continue
+                    labels = f'callback="{callback}",series="{name[:-len(kind) - 1]}"'
+                    for q in QUANTILES:
+                        lines.append(f'{metric}{{{labels},quantile="{q}"}} {stats[f"p{round(q * 100)}"]:.6g}')
+                    lines.append(f'{metric}_sum{{{labels}}} {stats["sum"]:.6g}')
+                    lines.append(f'{metric}_count{{{labels}}} {stats["count"]}')
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain')
+
+    # /metrics/profiles: cProfile reports of the slowest profiled requests
+    def profiles_view(self):
+        with self.lock:
+            profiles = sorted(self.profiles, reverse=True)
+        if not profiles:
+            text = 'No profiles captured; start with CALLBACK_PROFILE=0.1 to profile 10% of the requests\n'
+        else:
+            text = '\n'.join(f'=== {callback}: {seconds * 1000:.1f} ms ===\n{report}'
+                             for seconds, _, callback, report in profiles)
+        return Response(text, mimetype='text/plain')
+
+    def _before_request(self):
+        if not request.path.endswith(DASH_UPDATE_PATH):
+            return
+        timing = CallbackTiming(sampled=self.sample_rate > 0 and random.random() < self.sample_rate)
+        if self.profile_rate > 0 and random.random() < self.profile_rate:
+            timing.profiler = cProfile.Profile()
+            try:
+                timing.profiler.enable()
+            except ValueError:
+                # Another profiler is running on this thread
+                timing.profiler = None
+        self.local.timing = timing
+
+    def _after_request(self, response):
+        timing = getattr(self.local, 'timing', None)
+        if timing is None:
+            return response
+        self.local.timing = None
+        seconds = time.perf_counter() - timing.start
+        if timing.profiler is not None:
+            timing.profiler.disable()
+        name = timing.name or 'untimed'
+        self.observe(name, 'total_seconds', seconds)
+        self.observe(name, 'response_bytes', response.calculate_content_length() or 0)
+        if timing.callback_seconds is not None:
+            self.observe(name, 'callback_seconds', timing.callback_seconds)
+            # The measuring encode is not part of what Dash does
+            overhead = seconds - timing.callback_seconds - (timing.serialize_seconds or 0.0)
+            self.observe(name, 'overhead_seconds', overhead)
+            if timing.serialize_seconds is not None:
+                self.observe(name, 'serialize_seconds', timing.serialize_seconds)
+                self.observe(name, 'dispatch_seconds', max(overhead - timing.serialize_seconds, 0.0))
+        if timing.sampled:
+            for stage, stage_seconds in timing.stages.items():
+                self.observe(name, f'{stage}_seconds', stage_seconds)
+            self.observe(name, 'scanned_rows', timing.rows)
+        if timing.profiler is not None:
+            self._keep_profile(name, seconds, timing.profiler)
+        return response
+
+    def _teardown_request(self, _):
+        # The callback raised: drop its timing so the next request on this thread starts clean
+        timing = getattr(self.local, 'timing', None)
+        if timing is not None and timing.profiler is not None:
+            timing.profiler.disable()
+        self.local.timing = None
+
+    def _keep_profile(self, name, seconds, profiler):
+        with self.lock:
+            if len(self.profiles) >= self.profile_keep and seconds <= self.profiles[0][0]:
+                return
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+        entry = (seconds, next(self.profile_numbers), name, out.getvalue())
+        with self.lock:
+            if len(self.profiles) < self.profile_keep:
+                heapq.heappush(self.profiles, entry)
+            else:
+                heapq.heappushpop(self.profiles, entry)
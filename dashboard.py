@@ -0,0 +1,479 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import dash
+from dash import dash_table, dcc, html
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
+import plotly.graph_objs as go
+from aoi_ingest import DropDirectoryWatcher, LiveAOI
+from aoi_loader import AOI_CSV, load_aoi
+from callback_metrics import CallbackMetrics
+from defect_patterns import analyze_patterns
+from die_cube import DieCube
+from figure_cache import FigureCache, normalize_dates
+from figure_render import (PayloadMeter, rate_heatmap_figure, stacked_bar_figure, thumbnail_figure,
+                           wafer_heatmap_figure, zoom_ranges)
+from wafer_map import build_wafer_grid
+
+# New Spark part files dropped here are picked up while the app runs
+AOI_DROP_DIR = os.environ.get('AOI_DROP_DIR', 'aoi-drop')
+REFRESH_SECONDS = 5
+
+# Panels in page order; create_app registers all of them unless given a subset
+PANELS = ['stacked_bar', 'tester', 'pareto', 'wafer', 'compare', 'patterns']
+# Panels that read the inputs of another panel
+PANEL_REQUIRES = {'compare': 'wafer', 'patterns': 'wafer'}
+
+# Views of the wafer comparison panel
+COMPARE_VIEWS = [
+    {'label': 'Failure rate per die, selected lot', 'value': 'lot_rate'},
+    {'label': 'Failure rate per die, all lots', 'value': 'range_rate'},
+    {'label': 'Selected lot minus another lot', 'value': 'difference'},
+    {'label': 'All wafers of the selected lot', 'value': 'thumbnails'},
+]
+
+# Columns of the wafer pattern table
+PATTERN_COLUMNS = ['lot_id', 'wafer_id', 'pattern', 'fails', 'clusters', 'largest_cluster',
+                   'edge_ring', 'center', 'lot_repeating_dies']
+
+
+# Failing rows only: every panel shows failures
+def failing_rows(rows):
+    return rows[rows['pass_fail_flag'] == 'F']
+
+
+# The AOI rows shared by all panels of an app, the failing ones unless another row_filter is given
+def load_live_data(csv_path=AOI_CSV, row_filter=failing_rows):
+    """Load the data from the columnar cache of the CSV file (test_date_time is already
+    datetime, description is already string), group the failing rows by lot_id and
+    wafer_id and pre-aggregate the failure counts per day.
+
+    Callbacks read `live.snapshot` once and use its store and cube, so files ingested
+    in the background never show up halfway through a callback.
+    """
+    return LiveAOI(load_aoi(csv_path), row_filter=row_filter)
+
+
+# The stored rows tested between two dates
+def rows_between(store, start_date, end_date, metrics):
+    with metrics.stage('filter'):
+        rows = pd.concat(store.chunks, ignore_index=True) if len(store.chunks) > 1 else store.chunks[0]
+        metrics.add_rows(len(rows))
+        times = rows['test_date_time']
+        return rows[(times >= pd.Timestamp(start_date)) & (times <= pd.Timestamp(end_date))]
+
+
+# What the panels of one app share
+class DashboardContext:
+    def __init__(self, app, live, figure_cache, payload_meter, callback_metrics):
+        self.app = app
+        self.live = live
+        self.figure_cache = figure_cache
+        self.payload_meter = payload_meter
+        self.callback_metrics = callback_metrics
+
+
+# Build the AOI dashboard with the given panels
+def create_app(panels=None, live=None, csv_path=AOI_CSV, drop_dir=AOI_DROP_DIR, name=__name__,
+               row_filter=failing_rows, title=None, subtitle=None):
+    """Return a Dash app showing `panels` (default: all of PANELS) for the rows in
+    `live` (default: loaded from `csv_path`, keeping the rows `row_filter` keeps). The
+    default keeps the failing rows, which the charts count; row_filter=None keeps every
+    die, so wafer maps cover whole wafers and list lots without failures. `title` and
+    `subtitle` are shown above the panels.
+
+    The data is loaded before the app is returned, so a pre-forking server that creates
+    the app once and then forks its workers (dashboard_server.serve, or gunicorn --preload)
+    shares one copy of it between all workers.
+
+    New part files in `drop_dir` must be ingested by one process only. The watcher is
+    left in `app.server.extensions['aoi_watcher']`: dashboard_server.serve takes it
+    from there, polls it in its master process and forks fresh workers from the master
+    after every ingest. Under any other server the watcher runs as a thread of the
+    process that serves the first request.
+    """
+    panels = PANELS if panels is None else list(panels)
+    for panel in panels:
+        if panel not in PANELS:
+            raise ValueError(f'unknown panel {panel!r}, expected one of {PANELS}')
+        if PANEL_REQUIRES.get(panel, panel) not in panels:
+            raise ValueError(f'panel {panel!r} needs panel {PANEL_REQUIRES[panel]!r}')
+    if live is None:
+        live = load_live_data(csv_path, row_filter)
+
+    app = dash.Dash(name)
+    # Cache the figures of the callbacks; it is cleared whenever new data is ingested
+    figure_cache = FigureCache(version=lambda: live.version, max_entries=256)
+    # Time every callback request; stages and scanned rows for the CALLBACK_METRICS_SAMPLE share,
+    # figure encoding for the PAYLOAD_METER_SAMPLE share
+    payload_meter = PayloadMeter()
+    callback_metrics = CallbackMetrics(payload_meter=payload_meter)
+    callback_metrics.install(app)
+    ctx = DashboardContext(app, live, figure_cache, payload_meter, callback_metrics)
+
+    # Report the figure cache hit/miss counters
+    @app.server.route('/cache-stats')
+    def cache_stats():
+        return figure_cache.stats()
+
+    # Report the figure payload sizes and serialization times per callback
+    @app.server.route('/payload-stats')
+    def payload_stats():
+        return ctx.payload_meter.stats()
+
+    if drop_dir and os.path.isdir(drop_dir):
+        app.server.extensions['aoi_watcher'] = DropDirectoryWatcher(live, drop_dir, skip=[csv_path])
+        watcher_lock = threading.Lock()
+
+        @app.server.before_request
+        def start_watcher():
+            # Not there when a pre-forking server polls the watcher itself
+            watcher = app.server.extensions.get('aoi_watcher')
+            if watcher is not None and watcher.ident is None:
+                with watcher_lock:
+                    if watcher.ident is None:
+                        watcher.start()
+
+    layout = []
+    if title:
+        layout.append(html.H1(children=title))
+    if subtitle:
+        layout.append(html.Div(children=subtitle))
+    layout.extend(live_controls(ctx, panels))
+    for panel in panels:
+        layout.extend(PANEL_BUILDERS[panel](ctx))
+    app.layout = html.Div(layout)
+    return app
+
+
+# The WSGI application of create_app, e.g. for gunicorn --preload 'dashboard:create_server()'
+def create_server(panels=None, drop_dir=None):
+    # gunicorn's forked workers would each run their own watcher and keep diverging
+    # copies of the data, so live ingest is off unless asked for (use one worker then)
+    return create_app(panels, drop_dir=drop_dir).server
+
+
+# Date range picker and the refresh of the data version when new files were ingested
+def live_controls(ctx, panels):
+    app, live = ctx.app, ctx.live
+    first_date, last_date = live.snapshot.cube.time_range()
+    outputs = [Output('data-version', 'data'), Output('date-picker', 'max_date_allowed'),
+               Output('date-picker', 'end_date')]
+    if 'wafer' in panels:
+        outputs.append(Output('lot-dropdown', 'options'))
+    if 'compare' in panels:
+        outputs.append(Output('compare-lot', 'options'))
+
+    @app.callback(
+        outputs,
+        [Input('live-refresh', 'n_intervals')],
+        [State('data-version', 'data'), State('date-picker', 'max_date_allowed'), State('date-picker', 'end_date')])
+    @ctx.callback_metrics.timed()
+    def refresh_live_data(_, shown_version, max_date, end_date):
+        snapshot = live.snapshot
+        # A worker forked before the latest ingest may still answer while it drains
+        if shown_version is not None and snapshot.version <= shown_version:
+            raise PreventUpdate
+        _, newest = snapshot.cube.time_range()
+        # Follow the new data only if the range was open to the latest date
+        follow = end_date is None or max_date is None or pd.Timestamp(end_date).date() >= pd.Timestamp(max_date).date()
+        result = [snapshot.version, newest, newest if follow else dash.no_update]
+        options = [{'label': str(lot_id), 'value': lot_id} for lot_id in snapshot.store.lot_ids()]
+        if 'wafer' in panels:
+            result.append(options)
+        if 'compare' in panels:
+            result.append(options)
+        return result
+
+    return [
+        dcc.DatePickerRange(
+            id='date-picker',
+            min_date_allowed=first_date,
+            max_date_allowed=last_date,
+            initial_visible_month=first_date,
+            start_date=first_date,
+            end_date=last_date,
+            display_format='MMM Do, YY'
+        ),
+        # Version of the data shown, bumped by the refresh callback when new files were ingested
+        dcc.Store(id='data-version', data=live.version),
+        dcc.Interval(id='live-refresh', interval=REFRESH_SECONDS * 1000),
+    ]
+
+
+# Failures per lot, stacked by description
+def stacked_bar_panel(ctx):
+    @ctx.app.callback(Output('stacked-bar', 'figure'),
+                      [Input('date-picker', 'start_date'),
+                       Input('date-picker', 'end_date'),
+                       Input('data-version', 'data')])
+    @ctx.callback_metrics.timed()
+    @ctx.figure_cache.memoize(normalize=lambda start_date, end_date, _: normalize_dates(start_date, end_date))
+    def update_stacked_bar(start_date, end_date, _):
+        # Sum the pre-aggregated daily counts instead of regrouping the raw rows
+        with ctx.callback_metrics.stage('aggregate'):
+            grouped_df = ctx.live.snapshot.cube.counts(start_date, end_date, ['lot_id', 'description'])
+        ctx.callback_metrics.add_rows(len(grouped_df))
+        # One lot x description matrix instead of a filtered copy per description
+        with ctx.callback_metrics.stage('figure'):
+            return stacked_bar_figure(grouped_df)
+
+    return [dcc.Graph(id='stacked-bar')]
+
+
+# Failures per tester, stacked by description
+def tester_panel(ctx):
+    @ctx.app.callback(Output('tester-bar', 'figure'),
+                      [Input('date-picker', 'start_date'),
+                       Input('date-picker', 'end_date'),
+                       Input('data-version', 'data')])
+    @ctx.callback_metrics.timed()
+    @ctx.figure_cache.memoize(normalize=lambda start_date, end_date, _: normalize_dates(start_date, end_date))
+    def update_tester_bar(start_date, end_date, _):
+        # tester_id is one of the cube keys, so this is a sum of daily counts as well
+        with ctx.callback_metrics.stage('aggregate'):
+            grouped_df = ctx.live.snapshot.cube.counts(start_date, end_date, ['tester_id', 'description'])
+        ctx.callback_metrics.add_rows(len(grouped_df))
+        with ctx.callback_metrics.stage('figure'):
+            fig = stacked_bar_figure(grouped_df, x_column='tester_id')
+            fig.update_layout(title='Failures by Tester ID', xaxis_title='Tester ID', yaxis_title='Count')
+            return fig
+
+    return [dcc.Graph(id='tester-bar')]
+
+
+# Number of lots failing with every description, with its cumulative percentage
+def pareto_panel(ctx):
+    @ctx.app.callback(
+        Output('pareto-chart', 'figure'),
+        [Input('date-picker', 'start_date'),
+         Input('date-picker', 'end_date'),
+         Input('data-version', 'data')])
+    @ctx.callback_metrics.timed()
+    @ctx.figure_cache.memoize(normalize=lambda start_date, end_date, _: normalize_dates(start_date, end_date))
+    def update_pareto_chart(start_date, end_date, _):
+        # Distinct lot counts per description from the per-day lot bitmaps
+        with ctx.callback_metrics.stage('aggregate'):
+            desc_counts, total_count = ctx.live.snapshot.cube.distinct_lots(start_date, end_date)
+        ctx.callback_metrics.add_rows(len(desc_counts))
+        x = desc_counts.index.tolist()
+        y = desc_counts.tolist()
+        pct = [val/total_count*100 for val in y]
+        trace1 = go.Bar(x=x, y=y, name='Cumulative Count')
+        trace2 = go.Scattergl(x=x, y=pct, name='Cumulative Percentage')
+        layout = go.Layout(
+            title='Pareto Chart',
+            xaxis={'title': 'Description'},
+            yaxis={'title': 'Cumulative Count/Percentage'},
+            hovermode='closest'
+        )
+        return {'data': [trace1, trace2], 'layout': layout}
+
+    return [dcc.Graph(id='pareto-chart')]
+
+
+# Lot and wafer dropdowns and the die map of the selected wafer
+def wafer_panel(ctx):
+    app, live, metrics = ctx.app, ctx.live, ctx.callback_metrics
+    lot_ids = live.snapshot.store.lot_ids()
+
+    @app.callback(
+        Output('wafer-dropdown', 'options'),
+        [Input('lot-dropdown', 'value'), Input('data-version', 'data')]
+    )
+    @metrics.timed()
+    def update_wafer_dropdown(lot_id, _):
+        # Get the wafer_ids that contain 'F' in the pass_fail_flag column
+        with metrics.stage('filter'):
+            store = live.snapshot.store
+            wafer_ids = store.wafer_ids(lot_id, failing_only=True) or store.wafer_ids(lot_id)
+        # Return the options for the wafer-dropdown
+        return [{'label': str(wafer_id), 'value': wafer_id} for wafer_id in wafer_ids]
+
+    @app.callback(
+        [Output('wafer-dropdown', 'value'), Output('grid-plot', 'figure'), Output('f-text', 'children')],
+        [Input('lot-dropdown', 'value'), Input('wafer-dropdown', 'value'), Input('grid-plot', 'relayoutData'),
+         Input('data-version', 'data')]
+    )
+    @metrics.timed()
+    def update_output_div(lot_id, wafer_id, relayout, _):
+        if wafer_id is None:
+            # Set the wafer_id value to the first value in the options if no value is selected
+            # (the first wafer of a lot without failures, when every row is loaded)
+            store = live.snapshot.store
+            wafer_id = (store.wafer_ids(lot_id, failing_only=True) or store.wafer_ids(lot_id))[0]
+        zoom = None
+        if any(t['prop_id'] == 'grid-plot.relayoutData' for t in dash.callback_context.triggered):
+            zoom = zoom_ranges(relayout)
+            if zoom is None and not (relayout or {}).get('xaxis.autorange'):
+                # Autosize and other layout events do not change what is shown
+                raise PreventUpdate
+        return render_wafer(lot_id, wafer_id, zoom)
+
+    @ctx.figure_cache.memoize()
+    def render_wafer(lot_id, wafer_id, zoom):
+        # Select the rows with the specified lot_id and wafer_id
+        with metrics.stage('filter'):
+            df_selected = live.snapshot.store.rows(lot_id, wafer_id)
+        metrics.add_rows(len(df_selected))
+
+        # Build the grid of pass_fail_flag values (NaN coordinates are placed at 0)
+        with metrics.stage('aggregate'):
+            grid = build_wafer_grid(df_selected, dtype=np.uint8)
+
+        # Heatmap of uint8 codes: pooled down when the wafer is large, full resolution inside
+        # the zoomed window; the zoom is kept until another wafer is selected
+        with metrics.stage('figure'):
+            fig = wafer_heatmap_figure(grid, zoom, uirevision=f'{lot_id}/{wafer_id}')
+        # Count the total number of 'F' values in the pass_fail_flag column
+        f_count = df_selected['pass_fail_flag'].value_counts().get('F', 0)
+        # Create the text for displaying the 'F' count
+        f_text = f'Total F: {f_count}' if f_count > 0 else 'F equal to 0'
+        # Return the updated values for the wafer-dropdown, grid-plot, and f-text
+        return wafer_id, fig, f_text
+
+    return [
+        dcc.Dropdown(
+            id='lot-dropdown',
+            options=[{'label': str(lot_id), 'value': lot_id} for lot_id in lot_ids],
+            value=lot_ids[0],
+            searchable=True,
+            search_value='',
+            placeholder='Select a lot_id...',
+            clearable=False
+        ),
+        dcc.Dropdown(
+            id='wafer-dropdown',
+            value=None
+        ),
+        # Define the plot for displaying the grid data
+        dcc.Graph(
+            id='grid-plot'
+        ),
+        # Define the text for displaying the total number of 'F' values in the pass_fail_flag column
+        html.Div(id='f-text'),
+    ]
+
+
+# Wafers of the date range compared die by die: failure-rate overlays of a lot or of all
+# lots, the difference between two lots, and thumbnails of every wafer of a lot
+def compare_panel(ctx):
+    app, live, metrics = ctx.app, ctx.live, ctx.callback_metrics
+    lot_ids = live.snapshot.store.lot_ids()
+
+    # One (wafers, y, x) cube per date range and data version; the views only reduce it
+    @ctx.figure_cache.memoize(normalize=normalize_dates)
+    def die_cube(start_date, end_date):
+        snapshot = live.snapshot
+        rows = rows_between(snapshot.store, start_date, end_date, metrics)
+        with metrics.stage('aggregate'):
+            # Rates are per tested wafer, counting the wafers without failures as well
+            wafers = snapshot.wafers
+            tested = wafers[(wafers['last_test'] >= pd.Timestamp(start_date))
+                            & (wafers['first_test'] <= pd.Timestamp(end_date))]
+            return DieCube(rows, tested.astype({'lot_id': object}).groupby('lot_id').size())
+
+    @app.callback(
+        Output('compare-plot', 'figure'),
+        [Input('date-picker', 'start_date'),
+         Input('date-picker', 'end_date'),
+         Input('data-version', 'data'),
+         Input('lot-dropdown', 'value'),
+         Input('compare-view', 'value'),
+         Input('compare-lot', 'value')])
+    @metrics.timed()
+    def update_compare_plot(start_date, end_date, _, lot_id, view, other_lot):
+        cube = die_cube(start_date, end_date)
+        wafers = cube.tested_wafers([lot_id])
+        with metrics.stage('figure'):
+            if view == 'range_rate':
+                return rate_heatmap_figure(cube.fail_rate(), f'Failure rate per die, {cube.tested_wafers()} wafers '
+                                                             f'of {cube.total_lots} lots')
+            if view == 'difference':
+                if other_lot is None:
+                    raise PreventUpdate
+                return rate_heatmap_figure(cube.lot_difference(lot_id, other_lot),
+                                           f'Failure rate of lot {lot_id} minus lot {other_lot}', difference=True)
+            if view == 'thumbnails':
+                mosaic, labels = cube.thumbnails(lot_id)
+                return thumbnail_figure(mosaic, labels, f'Lot {lot_id}, {len(labels)} of {wafers} wafers with failures')
+            return rate_heatmap_figure(cube.fail_rate([lot_id]), f'Failure rate per die, lot {lot_id} ({wafers} wafers)')
+
+    return [
+        dcc.RadioItems(id='compare-view', options=COMPARE_VIEWS, value='lot_rate', inline=True),
+        dcc.Dropdown(
+            id='compare-lot',
+            options=[{'label': str(lot_id), 'value': lot_id} for lot_id in lot_ids],
+            value=lot_ids[1] if len(lot_ids) > 1 else lot_ids[0],
+            searchable=True,
+            placeholder='Lot to subtract...',
+            clearable=False
+        ),
+        dcc.Graph(id='compare-plot'),
+    ]
+
+
+# Spatial failure patterns of the wafers in the date range: dies failing on many wafers
+# of the selected lot, and the pattern table of every wafer (exportable as CSV)
+def patterns_panel(ctx):
+    app, live, metrics = ctx.app, ctx.live, ctx.callback_metrics
+
+    # Pattern analysis of every wafer with failures in the date range, all wafers in one batch
+    @ctx.figure_cache.memoize(normalize=normalize_dates)
+    def pattern_report(start_date, end_date):
+        rows = rows_between(live.snapshot.store, start_date, end_date, metrics)
+        with metrics.stage('aggregate'):
+            return analyze_patterns(rows)
+
+    @app.callback(
+        Output('pattern-table', 'data'),
+        [Input('date-picker', 'start_date'),
+         Input('date-picker', 'end_date'),
+         Input('data-version', 'data')])
+    @metrics.timed()
+    def update_pattern_table(start_date, end_date, _):
+        wafers = pattern_report(start_date, end_date).wafers
+        return wafers[PATTERN_COLUMNS].astype({'edge_ring': str, 'center': str}).to_dict('records')
+
+    @app.callback(
+        Output('repeat-map', 'figure'),
+        [Input('date-picker', 'start_date'),
+         Input('date-picker', 'end_date'),
+         Input('lot-dropdown', 'value'),
+         Input('data-version', 'data')])
+    @metrics.timed()
+    def update_repeat_map(start_date, end_date, lot_id, _):
+        report = pattern_report(start_date, end_date)
+        if lot_id not in report.lots:
+            raise PreventUpdate
+        counts = report.repeat_maps[report.lots.index(lot_id)]
+        # Upside down like the wafer heatmap
+        heatmap = go.Heatmap(z=counts[::-1].astype(np.uint16), colorscale='Reds', colorbar={'title': 'Wafers'})
+        layout = go.Layout(title=f'Failing wafers per die, lot {lot_id}',
+                           yaxis={'scaleanchor': 'x', 'scaleratio': 1}, height=500)
+        return go.Figure(data=[heatmap], layout=layout)
+
+    return [
+        dcc.Graph(id='repeat-map'),
+        dash_table.DataTable(
+            id='pattern-table',
+            columns=[{'name': col, 'id': col} for col in PATTERN_COLUMNS],
+            sort_action='native',
+            filter_action='native',
+            page_size=20,
+            export_format='csv'
+        ),
+    ]
+
+
+PANEL_BUILDERS = {
+    'stacked_bar': stacked_bar_panel,
+    'tester': tester_panel,
+    'pareto': pareto_panel,
+    'wafer': wafer_panel,
+    'compare': compare_panel,
+    'patterns': patterns_panel,
+}
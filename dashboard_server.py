@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from aoi_loader import AOI_CSV
+
+DASH_UPDATE_PATH = '/_dash-update-component'
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    # One log line per request costs more than a cached callback
+    def log_request(self, *args):
+        pass
+
+
+# Serve one WSGI app from `workers` forked processes accepting on one listening socket
+def serve(app, host='127.0.0.1', port=8050, workers=None):
+    """Pre-forking server: the app (with all its data) is created once in this process,
+    then every worker is forked from it, so the workers share the loaded dataset
+    copy-on-write instead of loading their own. gc.freeze() keeps the garbage collector
+    of the workers from writing to the shared objects. Each worker answers requests in
+    threads; dead workers are replaced, SIGINT/SIGTERM stops them all.
+
+    When the app has a drop directory watcher (create_app leaves it in the Flask
+    extensions), only this master process polls it. After an ingest a new set of
+    workers is forked, sharing the new data, and the old ones finish their requests
+    and exit; so the data is parsed and stored once, and every worker answering shows
+    the same data version.
+
+    The same model under gunicorn: gunicorn --preload -w 4 --threads 8 'dashboard:create_server()'
+    """
+    workers = workers or os.cpu_count()
+    wsgi_app = getattr(app, 'server', app)
+    watcher = getattr(wsgi_app, 'extensions', {}).pop('aoi_watcher', None)
+    listener = socket.create_server((host, port), backlog=1024)
+    children = set()
+    retired = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            server = make_server(host, port, wsgi_app, threaded=True, request_handler=QuietRequestHandler,
+                                 fd=listener.fileno())
+            # Finish the requests in flight when retired: stop accepting, then join the threads
+            server.daemon_threads = False
+            signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+            try:
+                server.serve_forever()
+                server.server_close()
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    # Fork a full set of workers from the current data
+    def spawn_all():
+        gc.freeze()
+        for _ in range(workers):
+            spawn()
+
+    def stop(signum, _):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    spawn_all()
+    print(f'serving on http://{host}:{port} with {workers} workers (pids {sorted(children)})', flush=True)
+    next_poll = time.monotonic()
+    while children:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid:
+            children.discard(pid)
+            if pid in retired:
+                retired.discard(pid)
+            elif not stopping:
+                print(f'worker {pid} exited, starting a new one', flush=True)
+                gc.freeze()
+                spawn()
+            continue
+        if watcher is not None and not stopping and time.monotonic() >= next_poll:
+            # Polled in this thread, so no other thread holds a lock when the workers fork
+            version = watcher.live.version
+            watcher.poll()
+            next_poll = time.monotonic() + watcher.interval
+            if watcher.live.version != version:
+                old = set(children)
+                spawn_all()
+                for pid in old:
+                    retired.add(pid)
+                    os.kill(pid, signal.SIGTERM)
+                print(f'data version {watcher.live.version}: workers {sorted(children - old)} replace '
+                      f'{sorted(old)}', flush=True)
+        time.sleep(0.1)
+    listener.close()
+
+
+# Resident and proportional set size of the server and its workers, in MB; a worker's PSS
+# counts the pages it shares with the others only partly, so it shows what it adds
+def memory_report(pid):
+    import psutil
+    parent = psutil.Process(pid)
+    report = {}
+    for process in [parent] + parent.children():
+        info = process.memory_full_info()
+        report[process.pid] = {'rss_mb': round(info.rss / 2**20, 1), 'pss_mb': round(info.pss / 2**20, 1),
+                               'uss_mb': round(info.uss / 2**20, 1)}
+    return report
+
+
+# One request on its own connection (the worker threads close the connection after every response)
+async def http_request(host, port, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b'\r\n\r\n')
+    return int(head.split(None, 2)[1]), content
+
+
+# Find a component of the layout JSON by id
+def find_component(node, component_id):
+    if isinstance(node, dict):
+        if node.get('props', {}).get('id') == component_id:
+            return node['props']
+        children = node.get('props', {}).get('children')
+        return find_component(children, component_id) if children is not None else None
+    if isinstance(node, list):
+        for child in node:
+            found = find_component(child, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+# The callback requests the browser sends for one user interaction
+def callback_requests(rng, lot_ids, first_day, days):
+    start = first_day + np.timedelta64(int(rng.integers(0, days)), 'D')
+    end = start + np.timedelta64(int(rng.integers(1, 8)), 'D')
+    dates = [{'id': 'date-picker', 'property': 'start_date', 'value': str(start)},
+             {'id': 'date-picker', 'property': 'end_date', 'value': str(end)},
+             {'id': 'data-version', 'property': 'data', 'value': 0}]
+    lot_id = lot_ids[int(rng.integers(0, len(lot_ids)))]
+    if rng.random() < 0.5:
+        # A new date range redraws the date-range charts
+        return [{'output': f'{graph}.figure', 'outputs': {'id': graph, 'property': 'figure'},
+                 'inputs': dates, 'changedPropIds': ['date-picker.start_date'], 'state': []}
+                for graph in ['stacked-bar', 'pareto-chart']]
+    # A new lot lists its wafers and draws the first one
+    return [{'output': 'wafer-dropdown.options', 'outputs': {'id': 'wafer-dropdown', 'property': 'options'},
+             'inputs': [{'id': 'lot-dropdown', 'property': 'value', 'value': lot_id},
+                        {'id': 'data-version', 'property': 'data', 'value': 0}],
+             'changedPropIds': ['lot-dropdown.value'], 'state': []},
+            {'output': '..wafer-dropdown.value...grid-plot.figure...f-text.children..',
+             'outputs': [{'id': 'wafer-dropdown', 'property': 'value'}, {'id': 'grid-plot', 'property': 'figure'},
+                         {'id': 'f-text', 'property': 'children'}],
+             'inputs': [{'id': 'lot-dropdown', 'property': 'value', 'value': lot_id},
+                        {'id': 'wafer-dropdown', 'property': 'value', 'value': None},
+                        {'id': 'grid-plot', 'property': 'relayoutData', 'value': None},
+                        {'id': 'data-version', 'property': 'data', 'value': 0}],
+             'changedPropIds': ['lot-dropdown.value'], 'state': []}]
+
+
+# Simulate `users` dashboard users for `seconds`, each pausing `think_ms` between interactions
+async def run_load(host, port, users, seconds, think_ms=1000):
+    """Load generator: returns the latency percentiles of the callback requests, their
+    throughput and the number of failed requests."""
+    _, layout = await http_request(host, port, 'GET', '/_dash-layout')
+    layout = json.loads(layout)
+    lot_ids = [option['value'] for option in find_component(layout, 'lot-dropdown')['options']]
+    picker = find_component(layout, 'date-picker')
+    first_day = np.datetime64(picker['min_date_allowed'][:10], 'D')
+    days = max(1, int((np.datetime64(picker['max_date_allowed'][:10], 'D') - first_day).astype(int)))
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+
+    async def user(seed):
+        nonlocal errors
+        rng = np.random.default_rng(seed)
+        # Users start spread over one think time
+        await asyncio.sleep(rng.random() * think_ms / 1000)
+        while time.perf_counter() < deadline:
+            for payload in callback_requests(rng, lot_ids, first_day, days):
+                start = time.perf_counter()
+                status, _ = await http_request(host, port, 'POST', DASH_UPDATE_PATH, payload)
+                latencies.append(time.perf_counter() - start)
+                errors += status not in (200, 204)
+            await asyncio.sleep(rng.exponential(think_ms / 1000))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(seed) for seed in range(users)))
+    elapsed = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99]) if latencies else [np.nan] * 3
+    return {'users': users, 'requests': len(latencies), 'errors': errors,
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(float(p50), 1), 'p95_ms': round(float(p95), 1), 'p99_ms': round(float(p99), 1)}
+
+
+async def wait_for_port(host, port, process, timeout=300):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if process.poll() is not None or time.perf_counter() > deadline:
+                raise RuntimeError('the server did not start')
+            await asyncio.sleep(0.2)
+
+
+# Start the server in its own process on a free port and step up the number of simulated users
+async def benchmark(args):
+    with socket.socket() as probe:
+        probe.bind((args.host, 0))
+        port = probe.getsockname()[1]
+    command = [sys.executable, os.path.abspath(__file__), args.csv, '--host', args.host, '--port', str(port),
+               '--workers', str(args.workers), '--panels', args.panels]
+    server = subprocess.Popen(command)
+    try:
+        await wait_for_port(args.host, port, server)
+        print(f'memory after start: {memory_report(server.pid)}')
+        capacity = 0
+        for users in [int(n) for n in args.users.split(',')]:
+            result = await run_load(args.host, port, users, args.seconds, args.think_ms)
+            print(f"{users:5d} users: {result['requests_per_second']:8.1f} req/s  p50 {result['p50_ms']} ms  "
+                  f"p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  errors {result['errors']}", flush=True)
+            if result['p95_ms'] <= args.target_ms and result['errors'] == 0:
+                capacity = users
+        print(f'memory after load: {memory_report(server.pid)}')
+        print(f'capacity: {capacity} concurrent users with p95 under {args.target_ms} ms '
+              f'({args.workers} workers, {os.cpu_count()} cores)')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the AOI dashboard from several worker processes')
+    parser.add_argument('csv', nargs='?', default=AOI_CSV)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--panels', default='all', help='comma separated panels of dashboard.PANELS')
+    parser.add_argument('--load', action='store_true', help='run the built-in load test against a local instance')
+    parser.add_argument('--users', default='1,4,16,64', help='simulated users per load step')
+    parser.add_argument('--seconds', type=float, default=15, help='length of every load step')
+    parser.add_argument('--think-ms', type=float, default=1000, help='mean pause of a user between interactions')
+    parser.add_argument('--target-ms', type=float, default=500, help='p95 latency a step must stay under')
+    args = parser.parse_args()
+    if args.load:
+        asyncio.run(benchmark(args))
+        return
+    from dashboard import create_app
+    panels = None if args.panels == 'all' else args.panels.split(',')
+    serve(create_app(panels, csv_path=args.csv), args.host, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import bisect
+import copy
+
+import numpy as np
+import pandas as pd
+
+CUBE_KEYS = ['lot_id', 'description', 'tester_id']
+
+
+# Failure counts pre-aggregated per time bucket
+class DefectCube:
+    """Counts of failure rows per time bucket by lot_id, description and tester_id.
+
+    Date-range queries add up the buckets that lie completely inside the range and
+    only look at the raw rows of the (at most two) buckets cut by the range edges,
+    so the answers match filtering the raw rows on test_date_time. Distinct lot
+    counts for the Pareto chart are exact: every bucket keeps one lot bitmap per
+    description (a Python int with one bit per lot) and a range query ORs them.
+    `append` only re-aggregates the buckets that received new rows.
+    """
+
+    def __init__(self, df=None, freq='1D', time_column='test_date_time'):
+        # Bucket width as a Timedelta string, e.g. '1D' or '1h'
+        self.freq = pd.Timedelta(freq)
+        self.time_column = time_column
+        # Sorted bucket start times, and per bucket: raw rows, counts and lot bitmaps
+        self.buckets = []
+        self.rows = {}
+        self.bucket_counts = {}
+        self.bucket_lots = {}
+        # lot_id -> bit position in the lot bitmaps
+        self.lot_bits = {}
+        self.lot_names = []
+        self.version = 0
+        if df is not None:
+            self.append(df)
+
+    # Add failure rows, re-aggregating only the buckets they fall into
+    def append(self, df):
+        if len(df) == 0:
+            return
+        df = df[[self.time_column] + CUBE_KEYS]
+        for lot_id in df['lot_id'].unique():
+            if lot_id not in self.lot_bits:
+                self.lot_bits[lot_id] = len(self.lot_names)
+                self.lot_names.append(lot_id)
+        starts = df[self.time_column].dt.floor(self.freq)
+        for bucket, rows in df.groupby(starts, sort=False):
+            if bucket in self.rows:
+                rows = pd.concat([self.rows[bucket], rows])
+            else:
+                bisect.insort(self.buckets, bucket)
+            rows = rows.sort_values(self.time_column, kind='stable')
+            self.rows[bucket] = rows
+            self.bucket_counts[bucket] = rows.groupby(CUBE_KEYS, observed=True).size()
+            self.bucket_lots[bucket] = self._lot_bitmaps(rows)
+        self.version += 1
+
+    # Earliest and latest failure time, or (None, None) when the cube is empty
+    def time_range(self):
+        if not self.buckets:
+            return None, None
+        return (self.rows[self.buckets[0]][self.time_column].iloc[0],
+                self.rows[self.buckets[-1]][self.time_column].iloc[-1])
+
+    # A copy that can be appended to without changing this cube; bucket frames and
+    # aggregates are shared, since append replaces them instead of modifying them
+    def copy(self):
+        other = copy.copy(self)
+        other.buckets = list(self.buckets)
+        other.rows = dict(self.rows)
+        other.bucket_counts = dict(self.bucket_counts)
+        other.bucket_lots = dict(self.bucket_lots)
+        other.lot_bits = dict(self.lot_bits)
+        other.lot_names = list(self.lot_names)
+        return other
+
+    # Failure counts grouped by `by` (any of lot_id, description, tester_id) between two dates
+    def counts(self, start_date, end_date, by=('lot_id', 'description')):
+        by = list(by)
+        full, partial = self._split(start_date, end_date)
+        parts = [self.bucket_counts[bucket] for bucket in full]
+        if len(partial):
+            parts.append(partial.groupby(CUBE_KEYS, observed=True).size())
+        if not parts:
+            return pd.DataFrame(columns=by + ['count'])
+        counts = pd.concat(parts).groupby(level=by, observed=True).sum()
+        return counts.reset_index(name='count')
+
+    # Number of distinct lots per description, and in total, between two dates
+    def distinct_lots(self, start_date, end_date):
+        full, partial = self._split(start_date, end_date)
+        bitmaps = [self.bucket_lots[bucket] for bucket in full]
+        if len(partial):
+            bitmaps.append(self._lot_bitmaps(partial))
+        merged = {}
+        for per_description in bitmaps:
+            for description, bits in per_description.items():
+                merged[description] = merged.get(description, 0) | bits
+        total = 0
+        for bits in merged.values():
+            total |= bits
+        desc_counts = pd.Series({description: bits.bit_count() for description, bits in merged.items()},
+                                dtype=int).sort_index()
+        desc_counts.index.name = 'description'
+        return desc_counts, total.bit_count()
+
+    # Buckets completely inside [start_date, end_date], and the raw rows of the edge buckets
+    def _split(self, start_date, end_date):
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        lo = bisect.bisect_right(self.buckets, start - self.freq)
+        hi = bisect.bisect_right(self.buckets, end)
+        full, edges = [], []
+        for bucket in self.buckets[lo:hi]:
+            if bucket >= start and bucket + self.freq <= end + pd.Timedelta(1, 'ns'):
+                full.append(bucket)
+            else:
+                rows = self.rows[bucket]
+                times = rows[self.time_column]
+                edges.append(rows[(times >= start) & (times <= end)])
+        partial = pd.concat(edges) if edges else []
+        return full, partial
+
+    # One bitmap of lots per description
+    def _lot_bitmaps(self, rows):
+        codes = rows['lot_id'].map(self.lot_bits).to_numpy(dtype=np.int64)
+        bitmaps = {}
+        for description, positions in rows.groupby('description', observed=True).indices.items():
+            present = np.zeros(len(self.lot_names), dtype=bool)
+            present[codes[positions]] = True
+            bitmaps[description] = int.from_bytes(np.packbits(present, bitorder='little').tobytes(), 'little')
+        return bitmaps
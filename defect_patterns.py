@@ -0,0 +1,171 @@
+import argparse
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+
+from aoi_loader import AOI_CSV, load_aoi
+from wafer_map import build_wafer_stack
+
+# Radial zones from the wafer center (0) to the edge (RADIAL_BINS - 1)
+RADIAL_BINS = 5
+# A zone is a pattern when its failure rate is this many times the rate of the other zones
+ZONE_RATIO = 2.0
+# ... and this many standard deviations above the failures that rate would give the zone,
+# so that small center zones do not light up from random failures
+ZONE_SIGMA = 3.0
+# Failing dies touching each other (8-neighbourhood) make a cluster from this size on
+MIN_CLUSTER_SIZE = 8
+# A die repeats when it fails on at least this many wafers and this share of its lot's wafers
+MIN_REPEAT_WAFERS = 3
+REPEAT_FRACTION = 0.3
+
+PatternReport = namedtuple('PatternReport', ['wafers', 'repeats', 'lots', 'repeat_maps'])
+REPEAT_COLUMNS = ['lot_id', 'die_x', 'die_y', 'failing_wafers', 'lot_wafers', 'fraction']
+
+
+# Columns of the wafer table analyze_patterns returns
+def wafer_columns(bins=RADIAL_BINS):
+    return (['lot_id', 'wafer_id', 'dies', 'fails', 'fail_rate', 'clusters', 'largest_cluster']
+            + [f'zone{k}_fail_rate' for k in range(bins)]
+            + ['edge_ring', 'center', 'lot_repeating_dies', 'pattern'])
+
+
+# Radial zone of every grid cell (-1 outside the wafer); the wafer is `outline` (dies tested on
+# any wafer) or, when only failing rows are known, the disc filling the grid
+def radial_zones(shape, outline=None, bins=RADIAL_BINS):
+    height, width = shape
+    yy, xx = np.mgrid[0:height, 0:width]
+    if outline is None:
+        cy, cx = (height - 1) / 2, (width - 1) / 2
+        radius = max(height, width) / 2
+        outline = (yy - cy) ** 2 + (xx - cx) ** 2 <= radius ** 2
+    else:
+        cy, cx = yy[outline].mean(), xx[outline].mean()
+        radius = np.sqrt((yy[outline] - cy) ** 2 + (xx[outline] - cx) ** 2).max() + 0.5
+    distance = np.sqrt((yy - cy) ** 2 + (xx - cx) ** 2) / radius
+    zones = np.minimum((distance * bins).astype(int), bins - 1)
+    return np.where(outline, zones, -1)
+
+
+# Connected failure clusters of every wafer, labelled in one pass over the whole stack
+def label_clusters(failing):
+    # Dies connect to their 8 neighbours on the same wafer only, never across wafers
+    structure = np.zeros((3, 3, 3), dtype=bool)
+    structure[1] = True
+    labels, count = ndimage.label(failing, structure=structure)
+    sizes = np.bincount(labels.ravel(), minlength=count + 1)
+    # Wafer of every label: the wafer index of any of its cells
+    label_wafer = np.zeros(count + 1, dtype=np.int64)
+    wafer_of_cell = np.broadcast_to(np.arange(failing.shape[0])[:, None, None], failing.shape)
+    label_wafer[labels.ravel()] = wafer_of_cell.ravel()
+    return labels, sizes, label_wafer
+
+
+# Per-wafer cluster, radial and pattern statistics, plus repeating failing dies per lot
+def analyze_patterns(df, bins=RADIAL_BINS, min_cluster_size=MIN_CLUSTER_SIZE, zone_ratio=ZONE_RATIO,
+                     min_repeat_wafers=MIN_REPEAT_WAFERS, repeat_fraction=REPEAT_FRACTION):
+    """Find spatial failure patterns in every wafer of `df` (AOI rows) at once.
+
+    All wafers are scattered into one (wafer, y, x) stack, and every statistic is a
+    whole-stack NumPy operation: connected components are labelled in a single
+    ndimage.label call, radial failure rates are one matrix product of the stack with
+    the zone indicator matrix, and repeating dies are an add.at of the stack per lot.
+    Returns a PatternReport of
+      wafers: one row per wafer with its counts, clusters, zone rates and `pattern`
+      repeats: one row per (lot, die) failing on many of the lot's wafers
+      lots / repeat_maps: the lot ids and the (lot, y, x) count of failing wafers per die
+    """
+    wafers, grids, tested = build_wafer_stack(df)
+    failing = grids > 0
+    n_wafers = len(wafers)
+    if n_wafers == 0:
+        # No rows, e.g. a date range without failures
+        return PatternReport(pd.DataFrame(columns=wafer_columns(bins)), pd.DataFrame(columns=REPEAT_COLUMNS),
+                             [], np.zeros((0, 1, 1), dtype=np.int32))
+
+    # Clusters
+    labels, sizes, label_wafer = label_clusters(failing)
+    big = sizes >= min_cluster_size
+    big[0] = False
+    clusters = np.bincount(label_wafer[big], minlength=n_wafers)
+    largest = np.zeros(n_wafers, dtype=np.int64)
+    np.maximum.at(largest, label_wafer[1:], sizes[1:])
+
+    # Radial zones: failures and dies per zone for every wafer as one matrix product
+    # Without passing rows (e.g. the dashboard's failing-only data) the outline is unknown
+    has_passing = bool((tested & ~failing).any())
+    zones = radial_zones(failing.shape[1:], tested.any(axis=0) if has_passing else None, bins).ravel()
+    inside = zones >= 0
+    indicator = np.zeros((zones.size, bins), dtype=np.float32)
+    indicator[np.flatnonzero(inside), zones[inside]] = 1
+    flat_failing = failing.reshape(n_wafers, -1).astype(np.float32)
+    zone_fails = flat_failing @ indicator
+    if has_passing:
+        zone_dies = tested.reshape(n_wafers, -1).astype(np.float32) @ indicator
+    else:
+        zone_dies = np.broadcast_to(indicator.sum(axis=0), zone_fails.shape)
+    zone_rate = zone_fails / np.maximum(zone_dies, 1)
+
+    # Zone k stands out when it fails far more than the rest of the wafer would predict
+    def stands_out(k):
+        rest = (zone_fails.sum(axis=1) - zone_fails[:, k]) / np.maximum(zone_dies.sum(axis=1) - zone_dies[:, k], 1)
+        expected = rest * zone_dies[:, k]
+        return (zone_fails[:, k] > zone_ratio * expected) & (
+            zone_fails[:, k] - expected > ZONE_SIGMA * np.sqrt(np.maximum(expected, 1)))
+    edge_ring = stands_out(bins - 1)
+    center = stands_out(0)
+
+    # Repeating dies: failing wafers per die for every lot
+    lot_codes, lots = pd.factorize(wafers['lot_id'])
+    repeat_maps = np.zeros((len(lots),) + failing.shape[1:], dtype=np.int32)
+    np.add.at(repeat_maps, lot_codes, failing)
+    lot_wafers = np.bincount(lot_codes, minlength=len(lots))
+    threshold = np.maximum(min_repeat_wafers, np.ceil(repeat_fraction * lot_wafers))
+    lot, die_y, die_x = np.nonzero(repeat_maps >= threshold[:, None, None])
+    repeats = pd.DataFrame({'lot_id': np.asarray(lots)[lot], 'die_x': die_x, 'die_y': die_y,
+                            'failing_wafers': repeat_maps[lot, die_y, die_x], 'lot_wafers': lot_wafers[lot]})
+    repeats['fraction'] = repeats['failing_wafers'] / repeats['lot_wafers']
+    repeat_dies = np.bincount(lot, minlength=len(lots))
+
+    # Wafer table
+    result = wafers.copy()
+    result['dies'] = tested.reshape(n_wafers, -1).sum(axis=1) if has_passing else int(inside.sum())
+    result['fails'] = flat_failing.sum(axis=1).astype(np.int64)
+    result['fail_rate'] = result['fails'] / np.maximum(result['dies'], 1)
+    result['clusters'] = clusters
+    result['largest_cluster'] = largest
+    for k in range(bins):
+        result[f'zone{k}_fail_rate'] = zone_rate[:, k]
+    result['edge_ring'] = edge_ring
+    result['center'] = center
+    result['lot_repeating_dies'] = repeat_dies[lot_codes]
+    result['pattern'] = np.select([edge_ring, center, clusters > 0], ['edge ring', 'center', 'cluster'], 'random')
+    repeats = repeats.sort_values(['lot_id', 'failing_wafers'], ascending=[True, False], ignore_index=True)
+    return PatternReport(result, repeats, list(lots), repeat_maps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find spatial failure patterns in the AOI wafers')
+    parser.add_argument('csv', nargs='?', default=AOI_CSV)
+    parser.add_argument('--start', default=None, help='only wafers tested from this date')
+    parser.add_argument('--end', default=None, help='only wafers tested up to this date')
+    parser.add_argument('--out', default='wafer_patterns.csv')
+    parser.add_argument('--repeats-out', default='repeating_dies.csv')
+    args = parser.parse_args()
+
+    df = load_aoi(args.csv)
+    if args.start:
+        df = df[df['test_date_time'] >= pd.Timestamp(args.start)]
+    if args.end:
+        df = df[df['test_date_time'] <= pd.Timestamp(args.end)]
+    report = analyze_patterns(df)
+    report.wafers.to_csv(args.out, index=False)
+    report.repeats.to_csv(args.repeats_out, index=False)
+    print(report.wafers['pattern'].value_counts().to_string())
+    print(f'{len(report.wafers)} wafers -> {args.out}, {len(report.repeats)} repeating dies -> {args.repeats_out}')
+
+
+if __name__ == '__main__':
+    main()
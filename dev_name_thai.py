@@ -1,69 +1,34 @@
 import csv
-import requests
-from io import StringIO
-import string
-from math import sqrt
+from entity_resolution import detect_encoding
+from name_matcher import preprocess, similar_pairs
 
-# Tokenize and preprocess the sentences
-def preprocess(sentence):
-    sentence = sentence.lower()
-    sentence = sentence.translate(str.maketrans('', '', string.punctuation))
-    tokens = sentence.split()
-    return tokens
+# Only report pairs at least this similar, and at most this many matches per developer
+SIMILARITY_THRESHOLD = 0.5
+TOP_K = 5
 
-# Create a bag-of-words vector for each sentence
-def create_vector(tokens, unique_words):
-    vector = []
-    for word in unique_words:
-        if word in tokens:
-            vector.append(tokens.count(word))
-        else:
-            vector.append(0)
-    return vector
-
-# Calculate the cosine similarity between two vectors
-def cosine_similarity(v1, v2):
-    dot_product = sum([v1[i] * v2[i] for i in range(len(v1))])
-    magnitude_v1 = sqrt(sum([x**2 for x in v1]))
-    magnitude_v2 = sqrt(sum([x**2 for x in v2]))
-    if magnitude_v1 == 0 or magnitude_v2 == 0:
-        return 0
-    else:
-        return dot_product / (magnitude_v1 * magnitude_v2)
-
-# Read the developer names from a CSV file
-def read_developer_names(file_url):
-    response = requests.get(file_url)
-    csv_buffer = StringIO(response.content.decode('utf-8'))
-    csv_reader = csv.reader(csv_buffer, delimiter=',')
-    # Skip the header row
-    next(csv_reader)
-    # Extract the developer names from the CSV file
-    developer_names = [row[0] for row in csv_reader]
+# Read the developer names from the local CSV file (saved as Mac Roman)
+def read_developer_names(file_path='dev_name.csv'):
+    with open(file_path, newline='', encoding=detect_encoding(file_path)) as f:
+        csv_reader = csv.reader(f, delimiter=',')
+        # Skip the header row
+        next(csv_reader)
+        # Extract the developer names from the CSV file
+        developer_names = [row[0] for row in csv_reader]
     return developer_names
 
-# Calculate the similarity between each pair of developer names
-def calculate_similarity(developer_names):
-    # Tokenize and preprocess the developer names
-    tokenized_names = [preprocess(name) for name in developer_names]
-    # Create a set of all unique words in all names
-    unique_words = set()
-    for tokens in tokenized_names:
-        unique_words.update(tokens)
-    # Create a bag-of-words vector for each name
-    vectors = [create_vector(tokens, unique_words) for tokens in tokenized_names]
-    # Calculate the cosine similarity between each pair of names
-    similarities = []
-    for i in range(len(developer_names)):
-        for j in range(i+1, len(developer_names)):
-            similarity = cosine_similarity(vectors[i], vectors[j])
-            similarities.append((i, j, similarity))
-    return similarities
+# Calculate the similarity between pairs of developer names that share a token
+def calculate_similarity(developer_names, threshold=SIMILARITY_THRESHOLD, top_k=TOP_K):
+    pairs = similar_pairs(developer_names, threshold=threshold, top_k=top_k)
+    # A pair among the top matches of both names comes back twice (i, j) and (j, i);
+    # report every pair once with i < j, like the all-pairs loop did
+    i = pairs[['i', 'j']].min(axis=1)
+    j = pairs[['i', 'j']].max(axis=1)
+    pairs = pairs.assign(i=i, j=j).drop_duplicates(['i', 'j']).sort_values(['i', 'j'], ignore_index=True)
+    return list(zip(pairs['i'].tolist(), pairs['j'].tolist(), pairs['similarity'].tolist()))
 
 # Main function
 def main():
-    file_url = "https://raw.githubusercontent.com/manhanton/DDE/main/dev_name.csv"
-    developer_names = read_developer_names(file_url)
+    developer_names = read_developer_names()
     similarities = calculate_similarity(developer_names)
     # Print the similarity scores
     for i, j, similarity in similarities:
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from figure_render import pool_grid
+from wafer_map import build_wafer_stack
+
+# Code of the blank lines between the thumbnails of a mosaic
+GAP_CODE = 2
+
+
+# Die codes of many wafers as one (wafers, y, x) uint8 cube, for comparing wafers and lots
+class DieCube:
+    """Built from the AOI rows of a lot or date range in a single build_wafer_stack
+    pass. Every view is a reduction over the cube, so switching between overlays,
+    lot differences and thumbnails never filters the raw rows again.
+
+    Failure rates are the share of a lot's tested wafers that fail at each die. With
+    only the failing rows loaded (as in the dashboards) wafers without any failure are
+    not in the cube, so pass the number of tested wafers per lot as `wafer_counts` (a
+    Series indexed by lot_id); otherwise only the wafers in the cube are counted.
+    """
+
+    def __init__(self, df, wafer_counts=None):
+        self.wafers, self.grids, _ = build_wafer_stack(df, dtype=np.uint8)
+        self.lot_codes, lots = pd.factorize(self.wafers['lot_id'])
+        self.lots = list(lots)
+        failing = self.grids > 0
+        # Failing wafers per die for every lot, summed once over the lot's wafers
+        order = np.argsort(self.lot_codes, kind='stable')
+        starts = np.searchsorted(self.lot_codes[order], np.arange(len(self.lots)))
+        if len(order):
+            self.lot_fails = np.add.reduceat(failing[order], starts, axis=0, dtype=np.uint32)
+        else:
+            self.lot_fails = np.zeros((0,) + self.grids.shape[1:], dtype=np.uint32)
+        self.lot_wafers = np.bincount(self.lot_codes, minlength=len(self.lots))
+        # Tested wafers and lots of the whole range, including lots without any failure
+        self.total_wafers, self.total_lots = int(self.lot_wafers.sum()), len(self.lots)
+        if wafer_counts is not None:
+            wafer_counts = pd.Series(wafer_counts)
+            tested = wafer_counts.reindex(pd.Index(self.lots, dtype=object)).fillna(0).to_numpy()
+            self.lot_wafers = np.maximum(self.lot_wafers, tested.astype(np.int64))
+            self.total_wafers = max(int(self.lot_wafers.sum()), int(wafer_counts.sum()))
+            self.total_lots = len(set(wafer_counts.index) | set(self.lots))
+
+    @property
+    def shape(self):
+        return self.grids.shape[1:]
+
+    # Positions of a lot's wafers in the cube
+    def wafer_index(self, lot_id):
+        if lot_id not in self.lots:
+            return np.array([], dtype=np.intp)
+        return np.flatnonzero(self.lot_codes == self.lots.index(lot_id))
+
+    # Tested wafers of some lots or (None) of the whole cube
+    def tested_wafers(self, lot_ids=None):
+        if lot_ids is None:
+            return self.total_wafers
+        return int(sum(self.lot_wafers[self.lots.index(lot_id)] for lot_id in lot_ids if lot_id in self.lots))
+
+    # Share of the wafers failing at every die, for some lots or (None) for the whole cube
+    def fail_rate(self, lot_ids=None):
+        if lot_ids is None:
+            fails, wafers = self.lot_fails.sum(axis=0), self.total_wafers
+        else:
+            index = [self.lots.index(lot_id) for lot_id in lot_ids if lot_id in self.lots]
+            fails, wafers = self.lot_fails[index].sum(axis=0), self.lot_wafers[index].sum()
+        return (fails / max(wafers, 1)).astype(np.float32)
+
+    # Failure rate of lot_a minus that of lot_b at every die
+    def lot_difference(self, lot_a, lot_b):
+        return self.fail_rate([lot_a]) - self.fail_rate([lot_b])
+
+    # Every wafer of a lot pooled to at most `side` dies across and tiled into one mosaic,
+    # `columns` wafers per row, first row on top; returns the mosaic (GAP_CODE between the
+    # tiles) and the (top row, left column, wafer_id) of every tile
+    def thumbnails(self, lot_id, side=32, columns=5):
+        index = self.wafer_index(lot_id)
+        if not len(index):
+            return np.zeros((0, 0), dtype=np.uint8), []
+        tiles = pool_grid(self.grids[index], max(1, -(-max(self.shape) // side)))
+        count, height, width = tiles.shape
+        rows = -(-count // columns)
+        # Every tile with a gap line below and to the right, then the tiles laid out row by row
+        framed = np.full((rows * columns, height + 1, width + 1), GAP_CODE, dtype=np.uint8)
+        framed[:count, :height, :width] = tiles
+        mosaic = framed.reshape(rows, columns, height + 1, width + 1).transpose(0, 2, 1, 3)
+        mosaic = mosaic.reshape(rows * (height + 1), columns * (width + 1))[:-1, :-1]
+        n = np.arange(count)
+        labels = list(zip((n // columns * (height + 1)).tolist(), (n % columns * (width + 1)).tolist(),
+                          self.wafers['wafer_id'].iloc[index].tolist()))
+        return mosaic, labels
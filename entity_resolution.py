@@ -0,0 +1,176 @@
+import argparse
+import codecs
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from scipy import sparse
+
+from name_matcher import normalize_rows, preprocess, term_matrix, top_k_per_row
+from parquet_reader import iter_batches
+
+
+# Read one name column from a CSV file or a Parquet file/directory, `chunk_size` names at a time
+def iter_names(path, column, chunk_size=50000):
+    if os.path.isdir(path) or path.endswith('.parquet'):
+        # Row groups come in whatever size they were written; regroup them into chunks
+        pending, rows = [], 0
+        for batch in iter_batches(path, [column]):
+            pending.append(batch.column(0))
+            rows += batch.num_rows
+            while rows >= chunk_size:
+                names = pa.chunked_array(pending)
+                yield names.slice(0, chunk_size).to_pandas()
+                rest = names.slice(chunk_size)
+                pending, rows = [rest], len(rest)
+        if rows:
+            yield pa.chunked_array(pending).to_pandas()
+        return
+    chunks = pd.read_csv(path, usecols=[column], chunksize=chunk_size, encoding=detect_encoding(path))
+    for chunk in chunks:
+        yield chunk[column]
+
+
+# The name lists are a mix of UTF-8 (with BOM) and Mac Roman files
+def detect_encoding(path, block_size=1 << 20):
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    with open(path, 'rb') as f:
+        try:
+            for block in iter(lambda: f.read(block_size), b''):
+                decoder.decode(block)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            return 'mac_roman'
+    return 'utf-8-sig'
+
+
+# Unique, non-empty names of a source, in order of first appearance
+def read_names(path, column):
+    names = pd.concat(list(iter_names(path, column)), ignore_index=True)
+    return names.dropna().astype(str).drop_duplicates().reset_index(drop=True)
+
+
+# Character n-grams of the normalized name, with a space marking the word boundaries
+def char_ngrams(name, n=3):
+    text = ' ' + ' '.join(preprocess(name)) + ' '
+    return [text[k:k + n] for k in range(len(text) - n + 1)]
+
+
+# Blocking keys of a name: the prefixes of its words that are not too common
+def blocking_keys(name, common_words, prefix_len=4):
+    return list({word[:prefix_len] for word in preprocess(name) if word not in common_words})
+
+
+# Links every name of source A to its best matches in source B
+class NameLinker:
+    """Character n-gram TF-IDF linking between two name sources.
+
+    Source B is vectorized and indexed once: its IDF weights, its unit-length TF-IDF
+    rows, and a sparse name-by-blocking-key matrix. Source A is then linked chunk by
+    chunk; only pairs that share a blocking key (the first letters of a word that
+    is not one of the `max_df` most common words, like 'co' or 'ltd') are scored, so
+    the full A x B product is never formed and memory is bounded by the chunk size
+    and, in link_source, by the `max_seen` hashes of names already linked.
+    """
+
+    def __init__(self, names_b, ngram=3, prefix_len=4, max_df=0.05):
+        self.names_b = pd.Series(names_b).astype(str).reset_index(drop=True)
+        self.ngram = ngram
+        self.prefix_len = prefix_len
+
+        # Words in more than max_df of the names are not used as blocking keys
+        words, word_vocab = term_matrix([set(preprocess(name)) for name in self.names_b])
+        doc_freq = np.bincount(words.indices, minlength=words.shape[1])
+        limit = max(1, max_df * len(self.names_b))
+        self.common_words = {word for word, col in word_vocab.items() if doc_freq[col] > limit}
+
+        # TF-IDF of the character n-grams, with the IDF fitted on source B
+        self.ngram_vocab = {}
+        counts, _ = term_matrix([char_ngrams(name, ngram) for name in self.names_b], self.ngram_vocab)
+        doc_freq = np.bincount(counts.indices, minlength=counts.shape[1])
+        self.idf = np.log((1 + len(self.names_b)) / (1 + doc_freq)) + 1
+        self.tfidf_b = normalize_rows(counts @ sparse.diags(self.idf))
+
+        self.key_vocab = {}
+        self.keys_b = self._key_matrix(self.names_b).T.tocsr()
+
+    # Score every name of `names_a` against its blocked candidates in B
+    def link(self, names_a, top_k=3, threshold=0.5):
+        names_a = pd.Series(names_a).astype(str).reset_index(drop=True)
+        keys_a = self._key_matrix(names_a, self.keys_b.shape[0])
+        shared = (keys_a @ self.keys_b).tocoo()
+        i, j = shared.row.astype(np.int64), shared.col.astype(np.int64)
+
+        tfidf_a = self.vectorize(names_a)
+        score = np.asarray(tfidf_a[i].multiply(self.tfidf_b[j]).sum(axis=1)).ravel() if len(i) else np.zeros(0)
+        keep = score >= threshold
+        i, j, score = top_k_per_row(i[keep], j[keep], score[keep], top_k)
+        return pd.DataFrame({'name_a': names_a.to_numpy()[i], 'name_b': self.names_b.to_numpy()[j],
+                             'index_b': j, 'score': score})
+
+    # Link a whole source, streamed chunk by chunk, skipping names already linked
+    def link_source(self, path, column, top_k=3, threshold=0.5, chunk_size=50000, max_seen=10_000_000):
+        """Names linked in earlier chunks are remembered as 64-bit hashes in one sorted
+        array, 8 bytes per distinct name and at most `max_seen` of them (80 MB by
+        default). Past that bound new names are still deduplicated within their chunk
+        and against the hashes kept, but may be linked again in a later chunk."""
+        seen = np.zeros(0, dtype=np.uint64)
+        for chunk in iter_names(path, column, chunk_size):
+            names = chunk.dropna().astype(str).drop_duplicates()
+            hashes = pd.util.hash_pandas_object(names, index=False).to_numpy()
+            position = np.minimum(np.searchsorted(seen, hashes), max(len(seen) - 1, 0))
+            new = seen[position] != hashes if len(seen) else np.ones(len(hashes), dtype=bool)
+            names, hashes = names[new], hashes[new]
+            room = max_seen - len(seen)
+            if room > 0:
+                seen = np.union1d(seen, hashes[:room])
+            if len(names):
+                yield self.link(names, top_k=top_k, threshold=threshold)
+
+    # Unit-length TF-IDF rows of some names, in the n-gram space of source B
+    def vectorize(self, names):
+        # N-grams never seen in B carry no weight, so they are left out of the vocabulary
+        vocab = dict(self.ngram_vocab)
+        counts, _ = term_matrix([char_ngrams(name, self.ngram) for name in names], vocab)
+        counts = counts[:, :len(self.idf)]
+        return normalize_rows(counts @ sparse.diags(self.idf))
+
+    def _key_matrix(self, names, size=None):
+        # Source B defines the key columns; keys only found in A can never match and are dropped
+        keys = [blocking_keys(name, self.common_words, self.prefix_len) for name in names]
+        vocab = self.key_vocab if size is None else dict(self.key_vocab)
+        matrix, _ = term_matrix(keys, vocab)
+        if size is not None:
+            matrix = matrix[:, :size]
+        return (matrix > 0).astype(np.float32).tocsr()
+
+
+# Split a 'path:column' source argument
+def parse_source(spec):
+    path, _, column = spec.rpartition(':')
+    return path, column
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Link the names of one source to the names of another')
+    parser.add_argument('--a', default='ddprop:project_name', help='source to resolve, as path:column')
+    parser.add_argument('--b', default='english_project_name.csv:english_project_name',
+                        help='reference source, as path:column')
+    parser.add_argument('--out', default='name_matches.csv')
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    linker = NameLinker(read_names(*parse_source(args.b)))
+    path_a, column_a = parse_source(args.a)
+    header = True
+    for matches in linker.link_source(path_a, column_a, args.top_k, args.threshold, args.chunk_size):
+        matches.to_csv(args.out, mode='w' if header else 'a', header=header, index=False)
+        header = False
+    print(f'wrote {args.out}')
+
+
+if __name__ == '__main__':
+    main()
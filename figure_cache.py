@@ -0,0 +1,106 @@
+import functools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Turn callback inputs into hashable, canonical values
+def normalize_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_value(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, normalize_value(v)) for k, v in value.items()))
+    return value
+
+
+# Date-picker inputs: '2023-02-01' and '2023-02-01T00:00:00' are the same query
+def normalize_dates(*args):
+    return tuple(None if arg is None else pd.Timestamp(arg).isoformat() for arg in args)
+
+
+# LRU cache of callback results, keyed by callback name, inputs and data version
+class FigureCache:
+    """Memoizes Dash callback results so repeated lot/date selections skip building
+    the figure again.
+
+    Entries are keyed by (callback name, normalized inputs, data version), where the
+    version comes from the `version` function given to the cache (for example the
+    version counters of the WaferStore and DefectCube). When the version changes all
+    cached entries are dropped. At most `max_entries` results are kept and the least
+    recently used one is evicted first.
+    """
+
+    def __init__(self, version=None, max_entries=256):
+        self.version = version if version is not None else (lambda: 0)
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.current_version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Decorator for a callback; `normalize` maps the inputs to the cache key
+    def memoize(self, name=None, normalize=None):
+        def decorator(func):
+            key_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args):
+                inputs = normalize(*args) if normalize is not None else normalize_value(args)
+                key = (key_name, inputs)
+                found, result = self.get(key)
+                if found:
+                    return result
+                version = self.current_version
+                result = func(*args)
+                # Not cached if the data moved on while it was being computed
+                self.put(key, result, version=version)
+                return result
+            return wrapper
+        return decorator
+
+    def get(self, key):
+        with self.lock:
+            self._check_version()
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    # Store a result; with `version`, only if the data version is still that one
+    def put(self, key, result, version=None):
+        with self.lock:
+            self._check_version()
+            if version is not None and version != self.current_version:
+                return
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    # Drop every cached result, e.g. after new data was loaded
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self.entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'data_version': self.current_version}
+
+    def _check_version(self):
+        version = self.version()
+        if version != self.current_version:
+            self.entries.clear()
+            self.current_version = version
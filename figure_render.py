@@ -0,0 +1,188 @@
+import functools
+import math
+import os
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+from plotly.io.json import to_json_plotly
+
+WAFER_COLORSCALE = [[0, 'green'], [1, 'red']]
+# Largest heatmap side sent to the browser; bigger grids (or zoom windows) are pooled down
+MAX_HEATMAP_SIDE = 256
+# Label every die on the axes only when this few are visible
+MAX_DIE_TICKS = 60
+# Share of the callback calls whose figures PayloadMeter encodes a second time to measure them
+PAYLOAD_SAMPLE_RATE = float(os.environ.get('PAYLOAD_METER_SAMPLE', '0.01'))
+
+
+# Shrink a grid (or a stack of grids, along the last two axes) by `factor` in both
+# directions, keeping the highest code of every block (a block with any failing die shows
+# as failing)
+def pool_grid(grid, factor):
+    grid = np.asarray(grid, dtype=np.uint8)
+    if factor <= 1:
+        return grid
+    lead, (height, width) = grid.shape[:-2], grid.shape[-2:]
+    rows, cols = -(-height // factor), -(-width // factor)
+    padded = np.zeros(lead + (rows * factor, cols * factor), dtype=np.uint8)
+    padded[..., :height, :width] = grid
+    return padded.reshape(lead + (rows, factor, cols, factor)).max(axis=(-3, -1))
+
+
+# The zoomed (x, y) ranges of a Graph's relayoutData as whole dies, None for an axis that
+# was not zoomed; None when the event is no zoom at all (autosize, reset, ...)
+def zoom_ranges(relayout):
+    ranges = []
+    for axis in ['xaxis', 'yaxis']:
+        low, high = (relayout or {}).get(f'{axis}.range[0]'), (relayout or {}).get(f'{axis}.range[1]')
+        if low is None or high is None:
+            ranges.append(None)
+        else:
+            ranges.append((math.floor(min(low, high)), math.ceil(max(low, high))))
+    return None if ranges == [None, None] else tuple(ranges)
+
+
+# Clip a zoomed range to [0, size - 1]; the full range when not zoomed or zoomed outside
+def clip_range(zoom, size):
+    if zoom is None:
+        return 0, size - 1
+    low, high = max(0, zoom[0]), min(size - 1, zoom[1])
+    return (low, high) if low <= high else (0, size - 1)
+
+
+# Heatmap of a wafer grid as compact uint8 codes; pooled when it is larger than max_side, and
+# cropped to the zoom_ranges() window at full resolution when zoomed in far enough
+def wafer_heatmap_figure(grid, zoom=None, max_side=MAX_HEATMAP_SIDE, uirevision=None):
+    # Rows are drawn upside down like the original grid[::-1] heatmap
+    display = np.asarray(grid)[::-1]
+    x_zoom, y_zoom = zoom or (None, None)
+    x0, x1 = clip_range(x_zoom, display.shape[1])
+    y0, y1 = clip_range(y_zoom, display.shape[0])
+    crop = display[y0:y1 + 1, x0:x1 + 1]
+    factor = max(1, math.ceil(max(crop.shape) / max_side))
+    heatmap = go.Heatmap(z=pool_grid(crop, factor), x0=x0 + (factor - 1) / 2, dx=factor,
+                         y0=y0 + (factor - 1) / 2, dy=factor, colorscale=WAFER_COLORSCALE, zmin=0, zmax=1)
+
+    # The axes always span the whole wafer, so double-click resets to the full view; the
+    # zoom itself is kept by plotly through `uirevision` while the zoomed data is swapped in
+    def axis(size, low, high, **extra):
+        dtick = 1 if high - low <= MAX_DIE_TICKS else None
+        return dict(range=[0, size - 1], autorange=False, dtick=dtick, **extra)
+    layout = go.Layout(
+        xaxis=axis(display.shape[1], x0, x1),
+        yaxis=axis(display.shape[0], y0, y1, scaleanchor='x', scaleratio=1),
+        margin=dict(l=50, r=50, b=50, t=50),
+        height=500,
+        uirevision=uirevision,
+    )
+    return go.Figure(data=[heatmap], layout=layout)
+
+
+# Heatmap of per-die failure rates, or with `difference` of the difference of two rates
+def rate_heatmap_figure(rates, title, difference=False, uirevision=None):
+    # Rows are drawn upside down like the wafer heatmap; rates are sent as float32
+    z = np.asarray(rates, dtype=np.float32)[::-1]
+    if difference:
+        limit = max(float(np.abs(z).max(initial=0)), 0.01)
+        colors = dict(colorscale='RdBu', reversescale=True, zmin=-limit, zmax=limit)
+    else:
+        colors = dict(colorscale='Reds', zmin=0, zmax=max(float(z.max(initial=0)), 0.01))
+    heatmap = go.Heatmap(z=z, colorbar={'title': 'Fail rate', 'tickformat': '.0%'}, **colors)
+    layout = go.Layout(title=title, yaxis={'scaleanchor': 'x', 'scaleratio': 1},
+                       margin=dict(l=50, r=50, b=50, t=50), height=500, uirevision=uirevision)
+    return go.Figure(data=[heatmap], layout=layout)
+
+
+# One heatmap of a mosaic of wafer thumbnails (codes 0 pass, 1 fail, 2 gap) labelled with
+# their wafer ids; a single trace however many wafers the lot has
+def thumbnail_figure(mosaic, labels, title):
+    z = np.asarray(mosaic, dtype=np.uint8)[::-1]
+    top = z.shape[0] - 1
+    heatmap = go.Heatmap(z=z, colorscale=[[0, 'green'], [0.5, 'red'], [1, 'white']], zmin=0, zmax=2,
+                         showscale=False, hoverinfo='skip')
+    annotations = [dict(x=col, y=top - row, text=str(wafer_id), showarrow=False, xanchor='left', yanchor='top',
+                        font={'size': 10})
+                   for row, col, wafer_id in labels]
+    layout = go.Layout(title=title, annotations=annotations, height=600,
+                       xaxis={'visible': False}, yaxis={'visible': False, 'scaleanchor': 'x', 'scaleratio': 1},
+                       margin=dict(l=20, r=20, b=20, t=50))
+    return go.Figure(data=[heatmap], layout=layout)
+
+
+# Stacked bars of counts per lot (or another `x_column`) and description from one pivoted
+# count matrix
+def stacked_bar_figure(grouped_df, x_column='lot_id'):
+    """One trace per description, all reading their y column from a single lot x description
+    matrix. The bars are placed with x0/dx and labelled with the lot names as tick text;
+    as the hover label would only show the bar position, every trace also carries the
+    lot names as customdata for its hovertemplate."""
+    lot_codes, lots = pd.factorize(grouped_df[x_column], sort=True)
+    desc_codes, descs = pd.factorize(grouped_df['description'], sort=True)
+    matrix = np.zeros((len(lots), len(descs)), dtype=np.int64)
+    np.add.at(matrix, (lot_codes, desc_codes), grouped_df['count'].to_numpy(dtype=np.int64))
+    # Biggest descriptions at the bottom of the stacks, like the sorted per-lot order before
+    order = np.argsort(-matrix.sum(axis=0), kind='stable')
+    dtype = np.uint16 if matrix.max(initial=0) < 2**16 else np.uint32
+    names = [str(lot) for lot in lots]
+    traces = [go.Bar(y=matrix[:, k].astype(dtype), x0=0, dx=1, name=str(descs[k]), width=0.5, customdata=names,
+                     hovertemplate='%{customdata}<br>%{fullData.name}: %{y}<extra></extra>') for k in order]
+    fig = go.Figure(data=traces)
+    fig.update_layout(barmode='stack', yaxis={'title': 'Count'},
+                      xaxis={'tickangle': 45, 'tickmode': 'array', 'tickvals': np.arange(len(lots)),
+                             'ticktext': names})
+    return fig
+
+
+# Size and serialization time of the JSON Dash sends for the figures of every callback
+class PayloadMeter:
+    """Encodes the figures a callback returns the way Dash does and records their size
+    and encoding time. That is a second full encode, so `measure()` only does it for
+    the `sample_rate` share of the calls (PAYLOAD_METER_SAMPLE, 1% by default); the
+    response size of every callback request is in CallbackMetrics' response_bytes.
+    """
+
+    def __init__(self, sample_rate=None):
+        self.sample_rate = PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.stats_by_name = {}
+        self.lock = threading.Lock()
+
+    # Encode the figures of one callback result and record them; returns the seconds it took
+    def record(self, name, result):
+        figures = [value for value in (result if isinstance(result, (list, tuple)) else [result])
+                   if isinstance(value, go.Figure) or (isinstance(value, dict) and 'data' in value)]
+        if not figures:
+            return 0.0
+        start = time.perf_counter()
+        size = sum(len(to_json_plotly(figure)) for figure in figures)
+        seconds = time.perf_counter() - start
+        with self.lock:
+            stats = self.stats_by_name.setdefault(name, {'calls': 0, 'bytes': 0, 'max_bytes': 0, 'seconds': 0.0})
+            stats['calls'] += 1
+            stats['bytes'] += size
+            stats['max_bytes'] = max(stats['max_bytes'], size)
+            stats['seconds'] += seconds
+            stats['last_bytes'] = size
+        return seconds
+
+    # Decorator measuring the figures a callback returns, for a sample of the calls
+    def measure(self, name=None):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                result = func(*args)
+                if self.sample_rate > 0 and random.random() < self.sample_rate:
+                    self.record(name or func.__name__, result)
+                return result
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self.lock:
+            return {name: {'calls': s['calls'], 'last_bytes': s['last_bytes'], 'max_bytes': s['max_bytes'],
+                           'mean_bytes': round(s['bytes'] / s['calls']),
+                           'mean_serialize_ms': round(s['seconds'] / s['calls'] * 1000, 3)}
+                    for name, s in self.stats_by_name.items()}
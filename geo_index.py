@@ -0,0 +1,158 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from entity_resolution import NameLinker, detect_encoding
+from parquet_reader import iter_batches
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+# Points on the unit sphere, so straight-line (chord) distance orders like haversine distance
+def to_unit_xyz(lat, lng):
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lng = np.radians(np.asarray(lng, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)])
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.asarray(km, dtype=float) / (2 * EARTH_RADIUS_KM))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=float) / 2, 0, 1))
+
+
+# Rows with a usable coordinate: not NaN and not the (0, 0) placeholder
+def valid_coordinates(lat, lng):
+    lat, lng = np.asarray(lat, dtype=float), np.asarray(lng, dtype=float)
+    return np.isfinite(lat) & np.isfinite(lng) & ~((lat == 0) & (lng == 0))
+
+
+# KD-tree over lat/lng points answering great-circle k-nearest and radius queries
+class GeoIndex:
+    """Spatial index over (lat, lng) points.
+
+    Points are stored as 3D unit vectors in a KD-tree; the straight-line distance
+    between unit vectors is a monotonic function of the haversine distance, so
+    nearest neighbours and radius searches are exact and distances are converted
+    back to kilometres. Points with missing coordinates are left out of the tree but
+    keep their original positions in the results.
+    """
+
+    def __init__(self, lat, lng):
+        valid = valid_coordinates(lat, lng)
+        self.positions = np.flatnonzero(valid)
+        self.tree = cKDTree(to_unit_xyz(np.asarray(lat, dtype=float)[valid], np.asarray(lng, dtype=float)[valid]))
+
+    def __len__(self):
+        return len(self.positions)
+
+    # k nearest points of every query: (distance_km, position), both shaped (n, k);
+    # missing neighbours (beyond max_km, or invalid queries) get inf and -1
+    def nearest(self, lat, lng, k=1, max_km=None):
+        valid = valid_coordinates(lat, lng)
+        distance = np.full((len(valid), k), np.inf)
+        position = np.full((len(valid), k), -1, dtype=np.int64)
+        if valid.any() and len(self):
+            bound = np.inf if max_km is None else km_to_chord(max_km)
+            chord, found = self.tree.query(to_unit_xyz(np.asarray(lat, dtype=float)[valid],
+                                                       np.asarray(lng, dtype=float)[valid]),
+                                           k=k, distance_upper_bound=bound)
+            chord, found = chord.reshape(-1, k), found.reshape(-1, k)
+            hit = found < len(self)
+            distance[valid] = np.where(hit, chord_to_km(np.where(hit, chord, 0)), np.inf)
+            position[valid] = np.where(hit, self.positions[np.minimum(found, len(self) - 1)], -1)
+        return distance, position
+
+    # Every (query, point) pair closer than radius_km, as flat arrays (query, position, distance_km)
+    def within(self, lat, lng, radius_km):
+        valid = valid_coordinates(lat, lng)
+        queries = np.flatnonzero(valid)
+        if not len(queries) or not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        query_tree = cKDTree(to_unit_xyz(np.asarray(lat, dtype=float)[valid], np.asarray(lng, dtype=float)[valid]))
+        pairs = query_tree.sparse_distance_matrix(self.tree, km_to_chord(radius_km), output_type='ndarray')
+        return queries[pairs['i']], self.positions[pairs['j']], chord_to_km(pairs['v'])
+
+
+# Links listings to named projects using both distance and name similarity
+class ProjectLinker:
+    """Attaches each listing to the best nearby project.
+
+    Candidates are the `k` nearest projects within `max_km`; each one is scored as
+    name_weight * name similarity + (1 - name_weight) * exp(-distance / distance_scale_km),
+    where the name similarity is the character n-gram TF-IDF cosine from NameLinker.
+    Listing names are not unique, so every link carries the listing's key (`ids`, by
+    default its position in `names`) as `listing_id`.
+    """
+
+    def __init__(self, projects, name_column='english_project_name', lat_column='field_location_lat',
+                 lng_column='field_location_lng'):
+        self.projects = projects.reset_index(drop=True)
+        self.name_column = name_column
+        self.geo = GeoIndex(self.projects[lat_column], self.projects[lng_column])
+        self.names = NameLinker(self.projects[name_column].fillna('').astype(str))
+
+    def link(self, names, lat, lng, k=5, max_km=1.0, name_weight=0.7, distance_scale_km=0.5, ids=None):
+        names = pd.Series(names).fillna('').astype(str).reset_index(drop=True)
+        ids = np.arange(len(names)) if ids is None else np.asarray(ids)
+        distance, position = self.geo.nearest(lat, lng, k=k, max_km=max_km)
+        listing = np.repeat(np.arange(len(names)), k)
+        distance, position = distance.ravel(), position.ravel()
+        found = position >= 0
+        listing, distance, position = listing[found], distance[found], position[found]
+
+        vectors = self.names.vectorize(names)
+        name_score = np.asarray(vectors[listing].multiply(self.names.tfidf_b[position]).sum(axis=1)).ravel() \
+            if len(listing) else np.zeros(0)
+        score = name_weight * name_score + (1 - name_weight) * np.exp(-distance / distance_scale_km)
+
+        # Best candidate of every listing
+        order = np.lexsort((-score, listing))
+        first = order[np.r_[True, np.diff(listing[order]) != 0]] if len(order) else order
+        best = pd.DataFrame({'project': self.projects[self.name_column].to_numpy()[position[first]],
+                             'project_index': position[first], 'distance_km': distance[first],
+                             'name_score': name_score[first], 'score': score[first]},
+                            index=listing[first])
+        result = pd.DataFrame({'listing_id': ids, 'listing': names}).join(best)
+        result['project_index'] = result['project_index'].astype('Int64')
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Attach Parquet listings to the nearest named project')
+    parser.add_argument('--listings', default='ddprop', help='Parquet file or directory of listings')
+    parser.add_argument('--id-column', default='id', help='listing key written with every link')
+    parser.add_argument('--name-column', default='project_name')
+    parser.add_argument('--lat-column', default='field_location_lat')
+    parser.add_argument('--lng-column', default='field_location_lng')
+    parser.add_argument('--projects', default='english_project_name.csv')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--max-km', type=float, default=1.0)
+    parser.add_argument('--name-weight', type=float, default=0.7)
+    parser.add_argument('--out', default='listing_projects.csv')
+    args = parser.parse_args()
+
+    projects = pd.read_csv(args.projects, encoding=detect_encoding(args.projects))
+    linker = ProjectLinker(projects)
+    columns = [args.id_column, args.name_column, args.lat_column, args.lng_column]
+    header, row = True, 0
+    for batch in iter_batches(args.listings, columns):
+        listings = batch.to_pandas()
+        lat = listings[args.lat_column].astype(float)
+        lng = listings[args.lng_column].astype(float)
+        links = linker.link(listings[args.name_column], lat, lng, k=args.k, max_km=args.max_km,
+                            name_weight=args.name_weight, ids=listings[args.id_column])
+        # Row of the listing in the source too, as the key column may repeat
+        links.insert(0, 'row', np.arange(row, row + len(links)))
+        row += len(links)
+        links.to_csv(args.out, mode='w' if header else 'a', header=header, index=False)
+        header = False
+    print(f'wrote {args.out}')
+
+
+if __name__ == '__main__':
+    main()
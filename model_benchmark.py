@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from sklearn import metrics
+from sklearn.base import clone
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+from sklearn.ensemble import AdaBoostClassifier, RandomForestClassifier
+from sklearn.model_selection import KFold, TimeSeriesSplit
+from sklearn.preprocessing import MinMaxScaler
+
+# Columns of the prepped trips that are not model features (Data_model_ML.ipynb)
+NON_FEATURES = ['tip_amount', 'target', 'PU_hour', 'DO_hour', 'PU_datetime', 'DO_datetime', 'PU_weekday',
+                'DO_weekday', 'VendorID', 'PULocationID', 'DOLocationID', 'fare_amount', 'extra', 'mta_tax',
+                'tolls_amount', 'improvement_surcharge', 'total_amount', 'PU_zone_name', 'DO_zone_name',
+                'PU_service_zone_name', 'DO_service_zone_name', 'month']
+SPLITS = ['holdout', 'kfold', 'time']
+
+
+def make_classifiers(seed=0):
+    return {
+        'LDA': LinearDiscriminantAnalysis(),
+        'Random Forests': RandomForestClassifier(random_state=seed),
+        'Ada Boost': AdaBoostClassifier(random_state=seed),
+    }
+
+
+# Feature matrix and tip/no-tip label of prepped trips, in PU_datetime order
+def features_and_target(df):
+    if 'PU_datetime' in df:
+        df = df.sort_values('PU_datetime', kind='stable')
+    target = (df['tip_amount'] > 0).to_numpy(dtype=np.int8)
+    features = df.drop(columns=[col for col in NON_FEATURES if col in df])
+    return features.astype(np.float32), target
+
+
+# (fold, train positions, test positions) for the chosen split strategy
+def make_splits(n, split='holdout', folds=5, train_fraction=0.7, seed=0):
+    if split == 'holdout':
+        # The notebook's split_data: first 70% to train, the rest to test, no shuffling
+        cut = int(train_fraction * n)
+        return [(0, np.arange(cut), np.arange(cut, n))]
+    if split == 'kfold':
+        splitter = KFold(n_splits=folds, shuffle=True, random_state=seed)
+    elif split == 'time':
+        splitter = TimeSeriesSplit(n_splits=folds)
+    else:
+        raise ValueError(f'unknown split {split!r}, expected one of {SPLITS}')
+    return [(fold, train, test) for fold, (train, test) in enumerate(splitter.split(np.zeros((n, 1))))]
+
+
+def peak_rss_mb():
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as status:
+            return next(int(line.split()[1]) for line in status if line.startswith('VmHWM')) / 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Train and score one classifier on one fold; runs in a fresh worker process
+def evaluate(name, estimator, data_dir, fold, train, test, trace_alloc=True):
+    X = np.load(os.path.join(data_dir, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(data_dir, 'y.npy'), mmap_mode='r')
+    scaler = MinMaxScaler()
+    X_train = scaler.fit_transform(X[train])
+    X_test = scaler.transform(X[test])
+    y_train, y_test = y[train], y[test]
+
+    # Timed without tracemalloc, which slows every allocation down
+    traced = clone(estimator)
+    start = time.perf_counter()
+    estimator.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    predicted = estimator.predict(X_test)
+    predict_seconds = time.perf_counter() - start
+
+    # Peak Python allocations in a second, untimed fit and predict of a fresh copy
+    peak_traced = float('nan')
+    if trace_alloc:
+        tracemalloc.start()
+        traced.fit(X_train, y_train)
+        traced.predict(X_test)
+        peak_traced = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    result = {
+        'classifier': name, 'fold': fold, 'train_rows': len(train), 'test_rows': len(test),
+        'fit_seconds': fit_seconds, 'predict_seconds': predict_seconds,
+        'predict_us_per_row': predict_seconds / max(len(test), 1) * 1e6,
+        'peak_alloc_mb': peak_traced / 2**20, 'peak_rss_mb': peak_rss_mb(),
+        'model_bytes': len(pickle.dumps(estimator)),
+        'accuracy': metrics.accuracy_score(y_test, predicted),
+        'f1_weighted': metrics.f1_score(y_test, predicted, average='weighted'),
+        'precision': metrics.precision_score(y_test, predicted, zero_division=0),
+        'recall': metrics.recall_score(y_test, predicted, zero_division=0),
+    }
+    if hasattr(estimator, 'predict_proba') and len(np.unique(y_test)) == 2:
+        result['roc_auc'] = metrics.roc_auc_score(y_test, estimator.predict_proba(X_test)[:, 1])
+    return result
+
+
+# Train and score every classifier on every fold in parallel worker processes
+def run_benchmark(features, target, classifiers=None, split='holdout', folds=5, workers=None, seed=0,
+                  trace_alloc=True):
+    """Compare classifiers on cost as well as quality.
+
+    Every (classifier, fold) pair runs in its own worker process, so the peak RSS
+    reported is that model's alone. The feature matrix is shared with the workers
+    through a memory-mapped .npy file instead of being pickled for every task. Fit
+    and predict are timed untraced; with `trace_alloc` every model is trained once
+    more under tracemalloc for its peak allocations.
+    Returns one row per (classifier, fold).
+    """
+    classifiers = classifiers or make_classifiers(seed)
+    splits = make_splits(len(target), split, folds, seed=seed)
+    data_dir = tempfile.mkdtemp(prefix='model-benchmark-')
+    try:
+        np.save(os.path.join(data_dir, 'X.npy'), np.ascontiguousarray(features, dtype=np.float32))
+        np.save(os.path.join(data_dir, 'y.npy'), np.asarray(target))
+        workers = min(workers or os.cpu_count() or 1, len(classifiers) * len(splits))
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+            futures = [pool.submit(evaluate, name, estimator, data_dir, fold, train, test, trace_alloc)
+                       for name, estimator in classifiers.items() for fold, train, test in splits]
+            for future in as_completed(futures):
+                row = future.result()
+                print(f"{row['classifier']:>15} fold {row['fold']}: accuracy {row['accuracy']:.4f}  "
+                      f"fit {row['fit_seconds']:.1f} s  peak {row['peak_rss_mb']:.0f} MB")
+                rows.append(row)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return pd.DataFrame(rows).sort_values(['classifier', 'fold'], ignore_index=True)
+
+
+# Mean and standard deviation of every measurement, one row per classifier
+def summarize(results):
+    measures = results.drop(columns=['fold']).groupby('classifier')
+    return measures.mean().join(measures.std().add_suffix('_std'))
+
+
+# Write <out>.csv (every fold) and <out>.json (folds, summary and run settings)
+def write_report(results, out, settings):
+    results.to_csv(f'{out}.csv', index=False)
+    summary = summarize(results)
+    report = {'settings': settings,
+              'summary': json.loads(summary.to_json(orient='index')),
+              'folds': json.loads(results.to_json(orient='records'))}
+    with open(f'{out}.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    return summary
+
+
+def load_trips(path, rows=None):
+    if os.path.isdir(path) or path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path, nrows=rows)
+    return df.iloc[:rows] if rows else df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the tip classifiers on quality and cost')
+    parser.add_argument('data', nargs='?', help='prepped trips: Parquet partition or CSV')
+    parser.add_argument('--rows', type=int, default=None, help='use only the first ROWS trips')
+    parser.add_argument('--split', choices=SPLITS, default='holdout')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default='model_benchmark')
+    parser.add_argument('--no-trace-alloc', action='store_true',
+                        help='skip the second, traced training that measures peak allocations')
+    parser.add_argument('--synthetic', type=int, metavar='ROWS', help='benchmark on ROWS synthetic trips instead')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from synthetic_data import make_taxi_month, make_taxi_zones
+        from taxi_pipeline import default_stages, run_pipeline
+        trips = next(run_pipeline([make_taxi_month(args.synthetic)], default_stages(make_taxi_zones())))
+    elif args.data:
+        trips = load_trips(args.data, args.rows)
+    else:
+        parser.error('give a data path or --synthetic ROWS')
+
+    features, target = features_and_target(trips)
+    print(f'{len(target)} trips, {features.shape[1]} features, split {args.split}')
+    results = run_benchmark(features, target, split=args.split, folds=args.folds, workers=args.workers,
+                            trace_alloc=not args.no_trace_alloc)
+    settings = {'data': args.data or f'synthetic:{args.synthetic}', 'rows': len(target), 'split': args.split,
+                'folds': args.folds if args.split != 'holdout' else 1, 'features': list(features.columns)}
+    summary = write_report(results, args.out, settings)
+    print(summary[['accuracy', 'f1_weighted', 'fit_seconds', 'predict_us_per_row', 'peak_rss_mb',
+                   'model_bytes']].to_string())
+
+
+if __name__ == '__main__':
+    main()
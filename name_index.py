@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from name_matcher import preprocess
+
+# Local copy of the developer list
+DEV_NAME_CSV = 'dev_name.csv'
+DEV_NAME_INDEX = 'dev_name.index'
+# Files of an index directory: the last full snapshot, and the changes made since
+SNAPSHOT_FILE = 'snapshot.npz'
+LOG_FILE = 'changes.jsonl'
+
+
+# Unit-length bag-of-words vector of a name: token -> weight, the vectors similar_pairs compares
+def name_vector(name):
+    counts = Counter(preprocess(name))
+    norm = np.sqrt(sum(count * count for count in counts.values())) or 1.0
+    return {token: count / norm for token, count in counts.items()}
+
+
+# Room for at least `size` entries, doubling the array when it is full
+def _grow(array, size):
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+# Persistent nearest-name index over the developer names
+class NameIndex:
+    """Every name is kept as its unit-length token vector, and every token as the list
+    of (name id, weight) pairs it appears in, so a query only scores the names sharing
+    a token with it; the cosine similarities are the ones similar_pairs computes.
+
+    On disk an index is a directory holding a snapshot (names, token vocabulary, the
+    CSR name vectors and the CSC inverted index, memory-friendly NumPy arrays) and a
+    JSON-lines log of the names added and removed since. Changes append one line to
+    the log and update the postings in memory, so nothing is rebuilt; compact() folds
+    the log into a new snapshot. Every change is numbered and the snapshot records the
+    last number it holds, so changes still in the log after a crash between writing the
+    snapshot and emptying the log are not replayed twice. Name ids are positions in the add order and never
+    change, removed names just stop matching.
+
+    Tokens found in more than `max_df` names (a count, or a fraction of the names as a
+    float), like 'co' and 'ltd', add to the similarity but do not make a name a
+    candidate on their own, as in similar_pairs.
+    """
+
+    def __init__(self, path=None, max_df=1000):
+        self.path = path
+        self.max_df = max_df
+        self.names = []
+        self.removed = np.zeros(0, dtype=bool)
+        self.vocabulary = {}
+        self.doc_freq = np.zeros(0, dtype=np.int64)
+        # Snapshot postings (CSC: names and weights of every token, ids ascending) and the
+        # postings of the names added since, per token
+        self.posting_start = np.zeros(1, dtype=np.int64)
+        self.posting_ids = np.zeros(0, dtype=np.int64)
+        self.posting_weights = np.zeros(0, dtype=np.float64)
+        self.added = {}
+        self.ids_by_name = {}
+        # Number of the last change made, logged with every change and saved in the snapshot
+        self.seq = 0
+
+    def __len__(self):
+        return int(len(self.names) - self.removed[:len(self.names)].sum())
+
+    # Index a list of names (duplicates are kept, each with its own id)
+    @classmethod
+    def build(cls, names, path=None, max_df=1000):
+        index = cls(path, max_df)
+        for name in names:
+            index._add(str(name))
+        index.compact()
+        return index
+
+    # Open an index directory: load the snapshot, then replay the changes logged since
+    @classmethod
+    def open(cls, path, max_df=1000):
+        index = cls(path, max_df)
+        with np.load(os.path.join(path, SNAPSHOT_FILE)) as snapshot:
+            index.names = snapshot['names'].tolist()
+            index.removed = snapshot['removed'].copy()
+            index.vocabulary = {token: col for col, token in enumerate(snapshot['tokens'].tolist())}
+            index.doc_freq = snapshot['doc_freq'].copy()
+            index.posting_start = snapshot['posting_start']
+            index.posting_ids = snapshot['posting_ids']
+            index.posting_weights = snapshot['posting_weights']
+            index.seq = int(snapshot['seq']) if 'seq' in snapshot else 0
+        for name_id, name in enumerate(index.names):
+            index.ids_by_name.setdefault(name, []).append(name_id)
+        log_path = os.path.join(path, LOG_FILE)
+        if os.path.exists(log_path):
+            with open(log_path, encoding='utf-8') as f:
+                for line in f:
+                    change = json.loads(line)
+                    if 'seq' in change:
+                        if change['seq'] <= index.seq:
+                            # Already in the snapshot
+                            continue
+                        index.seq = change['seq']
+                    if change['op'] == 'add':
+                        index._add(change['name'])
+                    else:
+                        index._remove(change['id'])
+        return index
+
+    # Add names without a rebuild; returns their ids
+    def add(self, names):
+        ids = [self._add(str(name)) for name in names]
+        self._log([{'op': 'add', 'name': self.names[name_id]} for name_id in ids])
+        return ids
+
+    # Stop matching some names, by id
+    def remove(self, ids):
+        ids = [name_id for name_id in ids if 0 <= name_id < len(self.names) and not self.removed[name_id]]
+        for name_id in ids:
+            self._remove(name_id)
+        self._log([{'op': 'remove', 'id': name_id} for name_id in ids])
+        return ids
+
+    # Ids of the indexed (not removed) names spelled exactly like `name`
+    def find(self, name):
+        return [name_id for name_id in self.ids_by_name.get(name, []) if not self.removed[name_id]]
+
+    def _add(self, name):
+        name_id = len(self.names)
+        self.names.append(name)
+        self.removed = _grow(self.removed, len(self.names))
+        self.ids_by_name.setdefault(name, []).append(name_id)
+        for token, weight in name_vector(name).items():
+            col = self.vocabulary.setdefault(token, len(self.vocabulary))
+            self.doc_freq = _grow(self.doc_freq, len(self.vocabulary))
+            self.doc_freq[col] += 1
+            self.added.setdefault(col, []).append((name_id, weight))
+        return name_id
+
+    def _remove(self, name_id):
+        self.removed[name_id] = True
+        for token in name_vector(self.names[name_id]):
+            self.doc_freq[self.vocabulary[token]] -= 1
+
+    def _log(self, changes):
+        for change in changes:
+            self.seq += 1
+            change['seq'] = self.seq
+        if self.path is None or not changes:
+            return
+        with open(os.path.join(self.path, LOG_FILE), 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(change, ensure_ascii=False) + '\n' for change in changes)
+
+    # Names and weights of every name containing a token (snapshot postings, then the added ones)
+    def _postings(self, col):
+        if col + 1 < len(self.posting_start):
+            start, end = self.posting_start[col], self.posting_start[col + 1]
+            ids, weights = self.posting_ids[start:end], self.posting_weights[start:end]
+        else:
+            ids, weights = np.zeros(0, dtype=np.int64), np.zeros(0)
+        if col in self.added:
+            added_ids, added_weights = zip(*self.added[col])
+            ids = np.concatenate([ids, np.array(added_ids, dtype=np.int64)])
+            weights = np.concatenate([weights, np.array(added_weights)])
+        return ids, weights
+
+    # The k indexed names most similar to `name`, as (id, name, similarity), best first
+    def nearest(self, name, k=5, threshold=0.0):
+        query = [(self.vocabulary[token], weight) for token, weight in name_vector(name).items()
+                 if token in self.vocabulary]
+        if not query:
+            return []
+        limit = self.max_df * len(self) if isinstance(self.max_df, float) else self.max_df
+        informative = [(col, weight) for col, weight in query if self.doc_freq[col] <= max(1, limit)]
+        common = [(col, weight) for col, weight in query if self.doc_freq[col] > max(1, limit)]
+        if not informative:
+            informative, common = query, []
+
+        # Dot products over the informative tokens, for the names sharing one of them
+        postings = [self._postings(col) for col, _ in informative]
+        ids = np.concatenate([ids for ids, _ in postings])
+        weights = np.concatenate([weights * query_weight for (_, weights), (_, query_weight)
+                                  in zip(postings, informative)])
+        candidates, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights, minlength=len(candidates))
+        # Add the common tokens the candidates contain (posting ids are ascending)
+        for col, query_weight in common:
+            ids, weights = self._postings(col)
+            position = np.minimum(np.searchsorted(ids, candidates), max(len(ids) - 1, 0))
+            if len(ids):
+                scores += np.where(ids[position] == candidates, weights[position], 0) * query_weight
+
+        keep = ~self.removed[candidates] & (scores >= threshold)
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[top], scores[top]
+        order = np.lexsort((candidates, -scores))
+        return [(int(name_id), self.names[name_id], float(score))
+                for name_id, score in zip(candidates[order], scores[order])]
+
+    # nearest() for a batch of names, as one frame of (query, rank, id, name, similarity)
+    def nearest_batch(self, names, k=5, threshold=0.0):
+        rows = [(query, rank, name_id, name, score) for query in names
+                for rank, (name_id, name, score) in enumerate(self.nearest(query, k, threshold), start=1)]
+        return pd.DataFrame(rows, columns=['query', 'rank', 'id', 'name', 'similarity'])
+
+    # Write a new snapshot holding every change and empty the log
+    def compact(self):
+        live = np.flatnonzero(~self.removed[:len(self.names)])
+        indptr, cols, weights = [0], [], []
+        for name_id in live.tolist():
+            for token, weight in name_vector(self.names[name_id]).items():
+                cols.append(self.vocabulary[token])
+                weights.append(weight)
+            indptr.append(len(cols))
+        # Inverted index: the (name, weight) entries sorted by token, then by name id
+        rows = np.repeat(live, np.diff(indptr))
+        cols, weights = np.array(cols, dtype=np.int64), np.array(weights, dtype=np.float64)
+        order = np.lexsort((rows, cols))
+        self.posting_start = np.concatenate([[0], np.cumsum(np.bincount(cols, minlength=len(self.vocabulary)))])
+        self.posting_ids, self.posting_weights = rows[order], weights[order]
+        self.added = {}
+        if self.path is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = os.path.join(self.path, SNAPSHOT_FILE + '.tmp.npz')
+        np.savez(tmp_path, names=np.array(self.names, dtype=str), removed=self.removed[:len(self.names)],
+                 tokens=np.array(list(self.vocabulary), dtype=str), doc_freq=self.doc_freq[:len(self.vocabulary)],
+                 vector_start=np.array(indptr, dtype=np.int64), vector_tokens=cols, vector_weights=weights,
+                 posting_start=self.posting_start, posting_ids=self.posting_ids,
+                 posting_weights=self.posting_weights, seq=np.int64(self.seq))
+        os.replace(tmp_path, os.path.join(self.path, SNAPSHOT_FILE))
+        open(os.path.join(self.path, LOG_FILE), 'w').close()
+
+
+# The developer names of the local CSV (Mac Roman or UTF-8), one per row like read_developer_names
+def read_name_file(path=DEV_NAME_CSV, column=None):
+    from entity_resolution import detect_encoding
+    names = pd.read_csv(path, encoding=detect_encoding(path), dtype=str, keep_default_na=False)
+    return names[column or names.columns[0]].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the indexed developer names most like a new name')
+    parser.add_argument('command', choices=['build', 'add', 'remove', 'query', 'compact'])
+    parser.add_argument('names', nargs='*', help='names to add, remove or look up')
+    parser.add_argument('--index', default=DEV_NAME_INDEX, help='index directory')
+    parser.add_argument('--csv', default=DEV_NAME_CSV, help='name list the index is built from')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--threshold', type=float, default=0.0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'build':
+        index = NameIndex.build(read_name_file(args.csv), args.index)
+        print(f'indexed {len(index)} names from {args.csv} in {time.perf_counter() - start:.2f} s')
+        return
+    index = NameIndex.open(args.index)
+    if args.command == 'add':
+        print(f'added ids {index.add(args.names)}')
+    elif args.command == 'remove':
+        print(f'removed ids {index.remove([name_id for name in args.names for name_id in index.find(name)])}')
+    elif args.command == 'compact':
+        index.compact()
+        print(f'{len(index)} names in the new snapshot')
+    else:
+        matches = index.nearest_batch(args.names, args.k, args.threshold)
+        print(matches.to_string(index=False))
+        print(f'{len(args.names)} queries in {(time.perf_counter() - start) * 1000:.1f} ms including the load')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import string
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+# Translation table that strips punctuation, built once
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+
+
+# Tokenize and preprocess the sentences
+def preprocess(sentence):
+    sentence = sentence.lower()
+    sentence = sentence.translate(PUNCTUATION_TABLE)
+    tokens = sentence.split()
+    return tokens
+
+
+# Build a sparse bag-of-words matrix (one row per name) from tokenized names
+def term_matrix(tokenized_names, vocabulary=None):
+    """Return (CSR count matrix, vocabulary). A vocabulary given by the caller is
+    extended in place with any new tokens."""
+    if vocabulary is None:
+        vocabulary = {}
+    indptr, indices, data = [0], [], []
+    for tokens in tokenized_names:
+        for word, count in Counter(tokens).items():
+            indices.append(vocabulary.setdefault(word, len(vocabulary)))
+            data.append(count)
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), indptr),
+                               shape=(len(tokenized_names), len(vocabulary)))
+    return matrix, vocabulary
+
+
+# Scale every row to unit length so a dot product is the cosine similarity
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+# Keep the k highest similarities for every value of `i`
+def top_k_per_row(i, j, similarity, k):
+    order = np.lexsort((-similarity, i))
+    i, j, similarity = i[order], j[order], similarity[order]
+    group_start = np.r_[0, np.flatnonzero(np.diff(i)) + 1]
+    rank = np.arange(len(i)) - np.repeat(group_start, np.diff(np.r_[group_start, len(i)]))
+    keep = rank < k
+    return i[keep], j[keep], similarity[keep]
+
+
+# Find similar pairs of names without comparing every pair
+def similar_pairs(names, threshold=0.5, top_k=None, max_df=1000, block_size=1024):
+    """Cosine similarity of the bag-of-words vectors of `names`, only for pairs that
+    share at least one informative token.
+
+    Tokens found in more than `max_df` names (a count, or a fraction of the names
+    when given as a float), like 'co' and 'ltd' in a large registry, still count in
+    the similarity but do not make two names a candidate pair on their own; pass
+    max_df=None to use every token. Candidates are found block by
+    block through the sparse token matrix, so memory stays bounded by `block_size`
+    rows at a time.
+
+    Returns a DataFrame of (i, j, similarity) with similarity >= threshold: unique
+    pairs with i < j, or, when `top_k` is given, the top_k best matches of every name.
+    """
+    counts, _ = term_matrix([preprocess(name) for name in names])
+    normalized = normalize_rows(counts)
+
+    # Split the tokens into informative ones (sparse, they generate candidates) and
+    # common ones (few columns, kept dense and only added to the candidates' scores)
+    doc_freq = np.bincount(counts.indices, minlength=counts.shape[1])
+    if max_df is None:
+        common = np.zeros(counts.shape[1], dtype=bool)
+    else:
+        limit = max_df * len(names) if isinstance(max_df, float) else max_df
+        common = doc_freq > max(1, limit)
+    informative = normalized[:, np.flatnonzero(~common)].tocsr()
+    informative_t = informative.T.tocsr()
+    common = normalized[:, np.flatnonzero(common)].toarray()
+    common_norm = np.sqrt(np.einsum('ij,ij->i', common, common))
+
+    pieces = []
+    for start in range(0, len(names), block_size):
+        # Dot products over the informative tokens, only for names sharing one of them
+        shared = (informative[start:start + block_size] @ informative_t).tocoo()
+        i, j = shared.row.astype(np.int64) + start, shared.col.astype(np.int64)
+        keep = j > i if top_k is None else j != i
+        i, j, similarity = i[keep], j[keep], shared.data[keep]
+        # Add the part of the dot product that comes from the common tokens, skipping
+        # pairs that cannot reach the threshold even if their common tokens all agree
+        if common.shape[1]:
+            keep = similarity + common_norm[i] * common_norm[j] >= threshold
+            i, j, similarity = i[keep], j[keep], similarity[keep]
+            similarity = similarity + np.einsum('ij,ij->i', common[i], common[j])
+        keep = similarity >= threshold
+        i, j, similarity = i[keep], j[keep], similarity[keep]
+        if top_k is not None:
+            i, j, similarity = top_k_per_row(i, j, similarity, top_k)
+        pieces.append(pd.DataFrame({'i': i, 'j': j, 'similarity': similarity}))
+
+    if not pieces:
+        return pd.DataFrame({'i': [], 'j': [], 'similarity': []})
+    pairs = pd.concat(pieces, ignore_index=True)
+    return pairs.sort_values(['i', 'similarity', 'j'], ascending=[True, False, True], ignore_index=True)
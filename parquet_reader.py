@@ -0,0 +1,131 @@
+import argparse
+import glob
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+
+# The data files of a Spark output directory (part-*.parquet), or a single file
+def find_parts(path):
+    if os.path.isfile(path):
+        return [path]
+    parts = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+    if not parts:
+        parts = sorted(p for p in glob.glob(os.path.join(path, '*.parquet'))
+                       if not os.path.basename(p).startswith(('_', '.')))
+    return parts
+
+
+# Filters are (column, op, value) tuples that must all hold, e.g. ('price_listing', '>', 1000000)
+def filter_expression(filters):
+    expression = None
+    for column, op, value in filters or []:
+        field = pc.field(column)
+        term = {'==': lambda: field == value, '=': lambda: field == value, '!=': lambda: field != value,
+                '<': lambda: field < value, '<=': lambda: field <= value,
+                '>': lambda: field > value, '>=': lambda: field >= value,
+                'in': lambda: field.isin(value), 'not in': lambda: ~field.isin(value)}[op]()
+        expression = term if expression is None else expression & term
+    return expression
+
+
+# Whether the min/max statistics of a row group allow any row to pass the filters
+def row_group_may_match(row_group, filters):
+    columns = {row_group.column(j).path_in_schema: row_group.column(j) for j in range(row_group.num_columns)}
+    for column, op, value in filters or []:
+        stats = columns[column].statistics if column in columns else None
+        if stats is None or not stats.has_min_max:
+            continue
+        low, high = stats.min, stats.max
+        try:
+            if ((op in ('==', '=') and (value < low or value > high))
+                    or (op == '<' and low >= value) or (op == '<=' and low > value)
+                    or (op == '>' and high <= value) or (op == '>=' and high < value)
+                    or (op == 'in' and all(v < low or v > high for v in value))):
+                return False
+        except TypeError:
+            # Statistics and filter value of different types: cannot prune on this column
+            continue
+    return True
+
+
+# Read one row group with column projection and the row filter applied
+def read_row_group(path, index, columns, filters):
+    table = pq.ParquetFile(path).read_row_group(index, columns=columns)
+    expression = filter_expression(filters)
+    if expression is not None:
+        table = table.filter(expression)
+        if columns is not None:
+            table = table.select(columns)
+    return table
+
+
+# Stream the record batches of a multi-part Parquet dataset, reading row groups in parallel
+def iter_batches(path, columns=None, filters=None, workers=None, executor='thread', ordered=True):
+    """Yield pyarrow RecordBatches of the part files under `path`.
+
+    Each row group is one unit of work. Row groups whose min/max statistics rule out
+    the filters are never read, the other ones are read with only the projected
+    `columns` (plus the filtered ones) and filtered row by row. At most two row
+    groups per worker are in flight at any time, so memory stays flat however many
+    part files there are. `executor` is 'thread' (Arrow releases the GIL while
+    decoding) or 'process'. With ordered=False batches are yielded as soon as they
+    are ready.
+    """
+    workers = workers or os.cpu_count() or 1
+    filter_columns = [column for column, _, _ in filters or []]
+    read_columns = None if columns is None else list(dict.fromkeys(list(columns) + filter_columns))
+
+    tasks = []
+    for part in find_parts(path):
+        metadata = pq.ParquetFile(part).metadata
+        for index in range(metadata.num_row_groups):
+            if row_group_may_match(metadata.row_group(index), filters):
+                tasks.append((part, index))
+
+    pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    with pool_class(max_workers=workers) as pool:
+        pending = deque()
+        tasks = iter(tasks)
+        for part, index in tasks:
+            pending.append(pool.submit(read_row_group, part, index, read_columns, filters))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = next(f for f in pending if f in done)
+                pending.remove(future)
+            table = future.result()
+            for part, index in tasks:
+                pending.append(pool.submit(read_row_group, part, index, read_columns, filters))
+                break
+            if columns is not None:
+                table = table.select(list(columns))
+            yield from table.to_batches()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the parallel Parquet reader throughput')
+    parser.add_argument('path', nargs='?', default='ddprop')
+    parser.add_argument('--columns', nargs='*')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread')
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        start = time.perf_counter()
+        rows = sum(batch.num_rows for batch in iter_batches(args.path, args.columns, workers=workers,
+                                                            executor=args.executor))
+        seconds = time.perf_counter() - start
+        print(f'{workers:>3} workers  {rows} rows  {seconds:6.3f} s  {rows / seconds:12.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
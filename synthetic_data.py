@@ -0,0 +1,143 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+BOROUGHS = ['Manhattan', 'Queens', 'Brooklyn', 'Bronx', 'EWR', 'Staten Island']
+
+
+# A taxi zone lookup table shaped like taxi+_zone_lookup.csv (265 zones, 264/265 unknown)
+def make_taxi_zones():
+    zones = pd.DataFrame({
+        'LocationID': np.arange(1, 266),
+        'Borough': [BOROUGHS[i % len(BOROUGHS)] for i in range(263)] + ['Unknown', 'Unknown'],
+        'Zone': [f'Zone {i}' for i in range(1, 264)] + ['NV', np.nan],
+        'service_zone': ['Boro Zone'] * 263 + ['N/A', 'N/A'],
+    })
+    return zones
+
+
+# One month of yellow-taxi-shaped trips, including the dirty rows the prep pipeline removes
+def make_taxi_month(rows, month='2018-01', seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(f'{month}-01')
+    days = start.days_in_month
+    pickup = start + pd.to_timedelta(rng.integers(0, days * 86400, rows), unit='s')
+    # A few trips end before they start, to exercise the negative-duration filter
+    dropoff = pickup + pd.to_timedelta(rng.integers(-60, 3600, rows), unit='s')
+    fare = rng.gamma(2.0, 6.0, rows).round(2)
+    fare[rng.random(rows) < 0.002] *= -1
+    trips = pd.DataFrame({
+        'VendorID': rng.integers(1, 3, rows),
+        'tpep_pickup_datetime': pickup.strftime('%Y-%m-%d %H:%M:%S'),
+        'tpep_dropoff_datetime': dropoff.strftime('%Y-%m-%d %H:%M:%S'),
+        'passenger_count': rng.choice(7, rows, p=[0.01, 0.7, 0.14, 0.04, 0.02, 0.06, 0.03]),
+        'trip_distance': rng.gamma(1.5, 2.0, rows).round(2),
+        'RatecodeID': rng.choice([1, 2, 3, 4, 5, 6, 99], rows, p=[0.96, 0.02, 0.004, 0.002, 0.012, 0.001, 0.001]),
+        'store_and_fwd_flag': rng.choice(['N', 'Y'], rows, p=[0.99, 0.01]),
+        'PULocationID': rng.integers(1, 266, rows),
+        'DOLocationID': rng.integers(1, 266, rows),
+        'payment_type': rng.choice([1, 2, 3, 4], rows, p=[0.7, 0.28, 0.01, 0.01]),
+        'fare_amount': fare,
+        'extra': rng.choice([0.0, 0.5, 1.0], rows),
+        'mta_tax': 0.5,
+        'tip_amount': np.where(rng.random(rows) < 0.6, (fare * rng.uniform(0.1, 0.3, rows)).round(2), 0.0),
+        'tolls_amount': np.where(rng.random(rows) < 0.05, 5.76, 0.0),
+        'improvement_surcharge': 0.3,
+    })
+    trips['total_amount'] = trips[['fare_amount', 'extra', 'mta_tax', 'tip_amount', 'tolls_amount',
+                                   'improvement_surcharge']].sum(axis=1).round(2)
+    return trips
+
+
+# Write yellow_tripdata_<month>.csv files plus a zone lookup into a directory
+def write_taxi_files(directory, months, rows, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    make_taxi_zones().to_csv(os.path.join(directory, 'taxi+_zone_lookup.csv'), index=False)
+    paths = []
+    for offset, month in enumerate(months):
+        path = os.path.join(directory, f'yellow_tripdata_{month}.csv')
+        make_taxi_month(rows, month, seed + offset).to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+# Failure descriptions of the die-bonding AOI with their share of the failing dies; a few
+# defects make up most failures, as on the real Pareto chart
+AOI_DESCRIPTIONS = {
+    'Epoxy Void': 0.34, 'Die Tilt': 0.22, 'Chipping': 0.15, 'Missing Die': 0.09, 'Foreign Material': 0.07,
+    'Crack': 0.05, 'Die Shift': 0.04, 'Epoxy Overflow': 0.02, 'Die Rotation': 0.01, 'nan': 0.01,
+}
+AOI_TESTERS = [f'KMI700E-{i}' for i in range(1, 7)]
+
+
+# AOI rows shaped like the Spark export: lots x wafers x round wafers of dies_across dies
+def make_aoi_frame(lots=20, wafers=25, dies_across=60, fail_rate=0.05, month='2023-02', seed=0):
+    """Every wafer gets its own failure rate around `fail_rate`, failing dies get a
+    description drawn from AOI_DESCRIPTIONS, and a few dies have no coordinates."""
+    rng = np.random.default_rng(seed)
+    r = dies_across / 2
+    yy, xx = np.mgrid[0:dies_across, 0:dies_across]
+    inside = (xx - r + 0.5) ** 2 + (yy - r + 0.5) ** 2 <= r ** 2
+    die_x, die_y = xx[inside].astype(float), yy[inside].astype(float)
+    dies, n_wafers = len(die_x), lots * wafers
+    n = n_wafers * dies
+    wafer_rates = np.repeat(np.clip(rng.gamma(4.0, fail_rate / 4.0, n_wafers), 0, 1), dies)
+    fail = rng.random(n) < wafer_rates
+    names = np.array(list(AOI_DESCRIPTIONS))
+    weights = np.array(list(AOI_DESCRIPTIONS.values()))
+    start = pd.Timestamp(f'{month}-01')
+    tested = start + pd.to_timedelta(np.sort(rng.integers(0, start.days_in_month * 86400, n_wafers)), unit='s')
+    df = pd.DataFrame({
+        'lot_id': np.repeat([f'LOT{i:05d}' for i in range(lots)], wafers * dies),
+        'wafer_id': np.tile(np.repeat(np.arange(1, wafers + 1), dies), lots),
+        'die_x': np.tile(die_x, n_wafers),
+        'die_y': np.tile(die_y, n_wafers),
+        'pass_fail_flag': np.where(fail, 'F', 'P'),
+        'description': np.where(fail, rng.choice(names, n, p=weights / weights.sum()), 'PASS'),
+        'tester_id': np.repeat(rng.choice(AOI_TESTERS, n_wafers), dies),
+        'test_date_time': np.repeat(tested, dies),
+        'operator': 'OP01',
+        'recipe': 'DB-STD',
+    })
+    missing = rng.random(n) < 0.0005
+    df.loc[missing, ['die_x', 'die_y']] = np.nan
+    return df
+
+
+# Write an AOI-shaped CSV for when the real export is not available
+def write_aoi_csv(path, **kwargs):
+    make_aoi_frame(**kwargs).to_csv(path, index=False)
+    return path
+
+
+# Developer company names like dev_name.csv, with near-duplicate spellings of some of them
+def make_developer_names(count=1000, duplicate_rate=0.2, seed=0):
+    rng = np.random.default_rng(seed)
+    first = ['Siam', 'Bangkok', 'Golden', 'Royal', 'Grand', 'Prime', 'Supalai', 'Ananda', 'Sansiri', 'Noble',
+             'Pruksa', 'Lumpini', 'Chao Phraya', 'Rama', 'Sukhumvit', 'Green', 'Sky', 'City', 'Urban', 'Asia']
+    second = ['Land', 'Property', 'Estate', 'Real Estate', 'Development', 'Asset', 'Home', 'Residence',
+              'Capital', 'Holding', 'Living', 'Builder']
+    suffixes = ['Co., Ltd.', 'Public Company Limited', 'Co.,Ltd.', 'Company Limited', '(Thailand) Co., Ltd.']
+    originals = count - int(count * duplicate_rate)
+    names = []
+    for _ in range(originals):
+        words = [rng.choice(first), rng.choice(second)]
+        if rng.random() < 0.3:
+            words.insert(0, str(rng.integers(1, 999)))
+        if rng.random() < 0.3:
+            words.insert(-1, rng.choice(first))
+        names.append(' '.join(words) + ' ' + rng.choice(suffixes))
+    # Near duplicates: other case, other suffix, or a dropped letter
+    for _ in range(count - originals):
+        name = names[rng.integers(0, originals)]
+        kind = rng.integers(0, 3)
+        if kind == 0:
+            name = name.upper()
+        elif kind == 1:
+            name = name.rsplit(' ', 2)[0] + ' ' + rng.choice(suffixes)
+        else:
+            cut = rng.integers(1, len(name) - 1)
+            name = name[:cut] + name[cut + 1:]
+        names.append(name)
+    return [names[i] for i in rng.permutation(len(names))]
@@ -0,0 +1,125 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from taxi_pipeline import month_of, process_month
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Rough peak memory of one worker: interpreter + pandas, plus the working set per chunk row
+WORKER_BASE_BYTES = 200 * 2**20
+BYTES_PER_CHUNK_ROW = 1500
+
+
+def available_memory():
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+# How many months can run at once without running out of memory
+def memory_safe_workers(requested, chunksize, memory_fraction=0.7):
+    per_worker = WORKER_BASE_BYTES + chunksize * BYTES_PER_CHUNK_ROW
+    return max(1, min(requested, int(available_memory() * memory_fraction // per_worker)))
+
+
+def partition_dir(out_dir, month):
+    return os.path.join(out_dir, f'month={month}')
+
+
+# A month is done once its partition has the _SUCCESS marker
+def month_done(out_dir, month):
+    return os.path.exists(os.path.join(partition_dir(out_dir, month), '_SUCCESS'))
+
+
+# Delete the staging directories a killed run left behind (one run per out_dir at a time)
+def remove_stale_staging(out_dir):
+    for name in os.listdir(out_dir):
+        path = os.path.join(out_dir, name)
+        if name.startswith('_staging-') and os.path.isdir(path):
+            print(f'removing {name} left by an interrupted run')
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# Clean one month into a temporary directory and move it into place when it is complete
+def run_month(path, zones_path, out_dir, chunksize):
+    month = month_of(path)
+    start = time.perf_counter()
+    staging = tempfile.mkdtemp(prefix=f'_staging-{month}-', dir=out_dir)
+    try:
+        rows = process_month(path, pd.read_csv(zones_path), staging, chunksize)
+        final = partition_dir(out_dir, month)
+        if os.path.exists(final):
+            # Leftovers of an interrupted run, without a _SUCCESS marker
+            shutil.rmtree(final)
+        os.replace(partition_dir(staging, month), final)
+        open(os.path.join(final, '_SUCCESS'), 'w').close()
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return month, rows, time.perf_counter() - start
+
+
+# Run the prep pipeline for every monthly file in parallel, skipping finished months
+def run_batch(files, zones_path, out_dir, workers=None, chunksize=500000, memory_fraction=0.7):
+    """Clean every monthly file into out_dir/month=YYYY-MM/ using worker processes.
+
+    The number of months processed at once is the smaller of `workers` and what fits
+    in `memory_fraction` of the available memory at the given chunk size. Months whose
+    partition already has a _SUCCESS marker are skipped, so an interrupted run can
+    simply be started again; staging directories a killed run left are deleted first.
+    Returns {month: rows written} for the months processed.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    remove_stale_staging(out_dir)
+    todo = [path for path in files if not month_done(out_dir, month_of(path))]
+    for path in files:
+        if path not in todo:
+            print(f'{month_of(path)}: already done, skipping')
+    if not todo:
+        return {}
+
+    workers = memory_safe_workers(min(workers or os.cpu_count() or 1, len(todo)), chunksize, memory_fraction)
+    print(f'processing {len(todo)} months with {workers} workers')
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_month, path, zones_path, out_dir, chunksize) for path in todo]
+        for future in as_completed(futures):
+            month, rows, seconds = future.result()
+            results[month] = rows
+            print(f'{month}: {rows} rows in {seconds:.1f} s')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean many monthly taxi files in parallel')
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--zones', default='taxi+_zone_lookup.csv')
+    parser.add_argument('--out', default='data-prep-yellow-2018')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=500000)
+    parser.add_argument('--memory-fraction', type=float, default=0.7)
+    parser.add_argument('--synthetic', type=int, metavar='ROWS',
+                        help='generate twelve synthetic 2018 months of ROWS trips and process those')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from synthetic_data import write_taxi_files
+        # The generated months are removed once they are processed
+        with tempfile.TemporaryDirectory(prefix='taxi-synthetic-') as directory:
+            files = write_taxi_files(directory, [f'2018-{m:02d}' for m in range(1, 13)], args.synthetic)
+            zones = os.path.join(directory, 'taxi+_zone_lookup.csv')
+            run_batch(files, zones, args.out, args.workers, args.chunksize, args.memory_fraction)
+        return
+    run_batch(args.files, args.zones, args.out, args.workers, args.chunksize, args.memory_fraction)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+# One-hot encoder with a frozen vocabulary and a fixed output layout
+class OneHotEncoder:
+    """Encodes categorical columns into a preallocated uint8 matrix in one pass.
+
+    `vocabulary` maps every column to its expected values; the output has one column
+    per (column, value) in that order, named like pd.get_dummies names them
+    ('RatecodeID_1.0', 'PU_weekday_Monday', ...). Values outside the vocabulary,
+    and missing values, encode as all zeros, like value_integrity did in the notebook,
+    so every chunk and every month produce exactly the same columns.
+    """
+
+    def __init__(self, vocabulary):
+        self.vocabulary = {col: list(values) for col, values in vocabulary.items()}
+        self.indexes = {col: pd.Index(values) for col, values in self.vocabulary.items()}
+        self.offsets = {}
+        offset = 0
+        for col, values in self.vocabulary.items():
+            self.offsets[col] = offset
+            offset += len(values)
+        self.n_features = offset
+
+    # Learn the vocabulary from data (sorted unique values), then keep it frozen
+    @classmethod
+    def fit(cls, df, columns):
+        return cls({col: sorted(df[col].dropna().unique().tolist()) for col in columns})
+
+    @property
+    def columns(self):
+        return list(self.vocabulary)
+
+    @property
+    def feature_names(self):
+        return [f'{col}_{value}' for col, values in self.vocabulary.items() for value in values]
+
+    # Row and column positions of the ones, for every column in a single pass; `df` can
+    # be a DataFrame or any mapping of column name to a Series/array
+    def positions(self, df):
+        rows, cols = [], []
+        for col, index in self.indexes.items():
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Map the few categories instead of hashing every row
+                values = pd.Categorical(values)
+                mapping = np.append(index.get_indexer(values.categories), -1)
+                codes = mapping[values.codes]
+            else:
+                codes = index.get_indexer(values)
+            hit = np.flatnonzero(codes >= 0)
+            rows.append(hit)
+            cols.append(codes[hit] + self.offsets[col])
+        return np.concatenate(rows), np.concatenate(cols)
+
+    # Encode into a dense uint8 matrix (or CSR with sparse_output=True)
+    def transform(self, df, sparse_output=False, out=None):
+        rows, cols = self.positions(df)
+        if sparse_output:
+            data = np.ones(len(rows), dtype=np.uint8)
+            return sparse.csr_matrix((data, (rows, cols)), shape=(len(df), self.n_features))
+        if out is None:
+            out = np.zeros((len(df), self.n_features), dtype=np.uint8)
+        else:
+            out[:] = 0
+        out[rows, cols] = 1
+        return out
+
+    # Replace the encoded columns of a frame with their one-hot columns
+    def transform_frame(self, df):
+        encoded = pd.DataFrame(self.transform(df), index=df.index, columns=self.feature_names)
+        return pd.concat([df.drop(columns=self.columns), encoded], axis=1)
@@ -0,0 +1,205 @@
+import argparse
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from taxi_encoder import OneHotEncoder
+
+# Columns of the 2018 yellow taxi trip files and the dtypes they are read with. Numeric
+# columns are float64 (payment_type nullable Int64) so every chunk has the same schema,
+# even when a column has NaNs.
+TRIP_DTYPES = {
+    'VendorID': 'float64', 'passenger_count': 'float64', 'trip_distance': 'float64',
+    'RatecodeID': 'float64', 'store_and_fwd_flag': 'object', 'PULocationID': 'float64',
+    'DOLocationID': 'float64', 'payment_type': 'Int64', 'fare_amount': 'float64', 'extra': 'float64',
+    'mta_tax': 'float64', 'tip_amount': 'float64', 'tolls_amount': 'float64',
+    'improvement_surcharge': 'float64', 'total_amount': 'float64',
+}
+TIMESTAMP_COLUMNS = ['tpep_pickup_datetime', 'tpep_dropoff_datetime']
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Location IDs 264 and 265 are the 'Unknown' zones of the lookup table
+UNKNOWN_LOCATION_IDS = [264, 265]
+NEG_FEATURES = ['trip_distance', 'trip_duration', 'fare_amount', 'extra', 'mta_tax', 'tip_amount',
+                'tolls_amount', 'improvement_surcharge']
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+# Pickup and dropoff both in these hours makes a rush-hour trip (Data_model_ML.ipynb)
+RUSH_HOURS = [16, 17, 18, 19, 20]
+BOROUGHS = ['Manhattan', 'Queens', 'Brooklyn', 'Bronx', 'EWR', 'Staten Island']
+
+# Expected values of every one-hot encoded column; anything else encodes as all zeros
+CATEGORY_VALUES = {
+    'RatecodeID': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+    'payment_type': [1, 2, 3, 4, 5, 6],
+    'PU_weekday': WEEKDAYS,
+    'DO_weekday': WEEKDAYS,
+}
+BOROUGH_VALUES = {'PU_borough_name': BOROUGHS, 'DO_borough_name': BOROUGHS}
+
+
+# Read a monthly trip file as fixed-size chunks
+def read_trip_chunks(path, chunksize=500000):
+    dtypes = dict(TRIP_DTYPES, **{col: 'object' for col in TIMESTAMP_COLUMNS})
+    return pd.read_csv(path, dtype=dtypes, chunksize=chunksize)
+
+
+# Drop the trips that start or end in an unknown location
+def remove_unknown_locations(df):
+    mask = ~(df['PULocationID'].isin(UNKNOWN_LOCATION_IDS) | df['DOLocationID'].isin(UNKNOWN_LOCATION_IDS))
+    return df[mask]
+
+
+def parse_timestamps(values):
+    return pd.to_datetime(values, format=TIMESTAMP_FORMAT)
+
+
+# Whole seconds since the epoch of datetime64 values (a Series or an array), and the NaT mask
+def epoch_seconds(times):
+    times = np.asarray(times).astype('datetime64[s]')
+    return times.astype(np.int64), np.isnat(times)
+
+
+# Hour, weekday, trip duration and rush-hour flag of parsed pickup/dropoff times, in one pass
+# of integer arithmetic on the epoch seconds (1970-01-01 was a Thursday, weekday 3)
+def time_features(pu_time, do_time):
+    pu_seconds, pu_nat = epoch_seconds(pu_time)
+    do_seconds, do_nat = epoch_seconds(do_time)
+    pu_hour = pu_seconds // 3600 % 24
+    do_hour = do_seconds // 3600 % 24
+    rush = np.isin(pu_hour, RUSH_HOURS) & np.isin(do_hour, RUSH_HOURS) & ~pu_nat & ~do_nat
+    duration = (np.asarray(do_time) - np.asarray(pu_time)) / np.timedelta64(1, 's')
+    return {
+        'trip_duration': duration,
+        'PU_weekday': pd.Categorical.from_codes(np.where(pu_nat, -1, (pu_seconds // 86400 + 3) % 7), WEEKDAYS),
+        'DO_weekday': pd.Categorical.from_codes(np.where(do_nat, -1, (do_seconds // 86400 + 3) % 7), WEEKDAYS),
+        # Nullable so chunks with and without NaT write the same Parquet schema
+        'PU_hour': pd.arrays.IntegerArray(np.where(pu_nat, 0, pu_hour), pu_nat),
+        'DO_hour': pd.arrays.IntegerArray(np.where(do_nat, 0, do_hour), do_nat),
+        'rush_hour': rush.astype(np.int8),
+    }
+
+
+# Parse the pickup/dropoff timestamps once and derive every time feature from them
+def process_timestamps(df):
+    pu_time = parse_timestamps(df['tpep_pickup_datetime'])
+    do_time = parse_timestamps(df['tpep_dropoff_datetime'])
+    df = df.drop(columns=TIMESTAMP_COLUMNS + ['store_and_fwd_flag'])
+    df['PU_datetime'] = pu_time
+    df['DO_datetime'] = do_time
+    for name, values in time_features(pu_time, do_time).items():
+        df[name] = values
+    return df
+
+
+# Negative-value and no-passenger filters fused into a single boolean mask
+def filter_invalid_trips(df):
+    mask = df['passenger_count'].to_numpy() != 0
+    for feature in NEG_FEATURES:
+        mask &= ~(df[feature].to_numpy() < 0)
+    return df[mask]
+
+
+# A column of the zone lookup as an array indexed by location ID (None where there is no zone)
+def zone_table(taxi_zones, column):
+    ids = taxi_zones['LocationID'].to_numpy(dtype=np.int64)
+    table = np.full(int(ids.max()) + 1, None, dtype=object)
+    table[ids] = taxi_zones[column].to_numpy()
+    return table
+
+
+# Borough, zone and service zone names by location ID, looked up in pre-built arrays
+def zone_lookup_stage(taxi_zones):
+    size = int(taxi_zones['LocationID'].max()) + 1
+    ids = taxi_zones['LocationID'].to_numpy(dtype=np.int64)
+    tables = {col: zone_table(taxi_zones, col) for col in ['Borough', 'Zone', 'service_zone']}
+    known = np.zeros(size, dtype=bool)
+    known[ids] = True
+
+    def lookup(df):
+        pu = df['PULocationID'].fillna(-1).to_numpy(dtype=np.int64)
+        do = df['DOLocationID'].fillna(-1).to_numpy(dtype=np.int64)
+        # Like the inner merges: keep only trips whose both location IDs are in the table
+        in_range = (pu >= 0) & (pu < size) & (do >= 0) & (do < size)
+        pu, do = np.where(in_range, pu, 0), np.where(in_range, do, 0)
+        keep = in_range & known[pu] & known[do]
+        df = df[keep].copy()
+        pu, do = pu[keep], do[keep]
+        for prefix, location in [('PU', pu), ('DO', do)]:
+            df[f'{prefix}_borough_name'] = tables['Borough'][location]
+            df[f'{prefix}_zone_name'] = tables['Zone'][location]
+            df[f'{prefix}_service_zone_name'] = tables['service_zone'][location]
+        return df[df['PU_borough_name'].notna()]
+    return lookup
+
+
+def add_total_initial_fare(df):
+    df['total_initial_fare'] = (df['fare_amount'] + df['extra'] + df['mta_tax'] + df['tolls_amount']
+                                + df['improvement_surcharge'])
+    return df
+
+
+# The cleaning steps of Data_prep_yellow_2018.ipynb, in notebook order
+def default_stages(taxi_zones):
+    return [
+        remove_unknown_locations,
+        process_timestamps,
+        filter_invalid_trips,
+        OneHotEncoder(CATEGORY_VALUES).transform_frame,
+        zone_lookup_stage(taxi_zones),
+        add_total_initial_fare,
+        OneHotEncoder(BOROUGH_VALUES).transform_frame,
+    ]
+
+
+# Apply the stages to every chunk, one chunk at a time
+def run_pipeline(chunks, stages):
+    for chunk in chunks:
+        for stage in stages:
+            chunk = stage(chunk)
+        yield chunk
+
+
+# Month key of a monthly file name, e.g. yellow_tripdata_2018-12.csv -> 2018-12
+def month_of(path):
+    match = re.search(r'(\d{4}-\d{2})', os.path.basename(path))
+    return match.group(1) if match else os.path.splitext(os.path.basename(path))[0]
+
+
+# Write the processed chunks as Parquet part files under out_dir/month=<month>/
+def write_partition(chunks, out_dir, month):
+    partition = os.path.join(out_dir, f'month={month}')
+    os.makedirs(partition, exist_ok=True)
+    rows = 0
+    for number, chunk in enumerate(chunks):
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        pq.write_table(table, os.path.join(partition, f'part-{number:05d}.parquet'))
+        rows += len(chunk)
+    return rows
+
+
+# Clean one monthly file into its Parquet partition
+def process_month(path, taxi_zones, out_dir, chunksize=500000):
+    chunks = run_pipeline(read_trip_chunks(path, chunksize), default_stages(taxi_zones))
+    return write_partition(chunks, out_dir, month_of(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean yellow taxi trip files chunk by chunk into Parquet')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--zones', default='taxi+_zone_lookup.csv')
+    parser.add_argument('--out', default='data-prep-yellow-2018')
+    parser.add_argument('--chunksize', type=int, default=500000)
+    args = parser.parse_args()
+
+    taxi_zones = pd.read_csv(args.zones)
+    for path in args.files:
+        rows = process_month(path, taxi_zones, args.out, args.chunksize)
+        print(f'{path}: {rows} rows -> {args.out}/month={month_of(path)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from taxi_encoder import OneHotEncoder
+from taxi_pipeline import TIMESTAMP_COLUMNS, parse_timestamps, time_features, zone_table
+from tip_training import load_bundle
+
+NUMERIC_INPUTS = ['passenger_count', 'trip_distance', 'RatecodeID', 'payment_type', 'PULocationID',
+                  'DOLocationID', 'fare_amount', 'extra', 'mta_tax', 'tolls_amount', 'improvement_surcharge']
+FARE_COLUMNS = ['fare_amount', 'extra', 'mta_tax', 'tolls_amount', 'improvement_surcharge']
+
+
+# Column arrays of a list of raw trip records; raises ValueError on malformed trips, so a
+# bad request fails on its own instead of failing the whole micro-batch
+def trip_columns(trips):
+    columns = {col: np.array([trip.get(col) for trip in trips], dtype=float) for col in NUMERIC_INPUTS}
+    for col in TIMESTAMP_COLUMNS:
+        # NumPy parses the ISO 'YYYY-MM-DD HH:MM:SS' strings far faster than pandas on tiny inputs
+        columns[col] = np.array([trip[col] for trip in trips], dtype='datetime64[s]')
+    return columns
+
+
+def as_datetime(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return pd.Series(values)
+    return pd.Series(parse_timestamps(values))
+
+
+def concat_columns(parts):
+    return {col: np.concatenate([part[col] for part in parts]) for col in parts[0]}
+
+
+# Turns raw trips (the columns of the monthly trip files) into the model's feature matrix
+class TipScorer:
+    """Scores raw trips with a model bundle saved by tip_training.py.
+
+    Applies the prep and model notebook transforms without dropping any row: time
+    features from the timestamps, borough names from the zone lookup, the total
+    initial fare and the one-hot columns from the bundle's frozen vocabulary. Every
+    step works on whole column arrays and writes into one preallocated matrix in the
+    bundle's feature order, so a micro-batch costs a handful of NumPy calls.
+    """
+
+    def __init__(self, bundle, taxi_zones):
+        self.scaler = bundle['scaler']
+        self.model = bundle['model']
+        self.columns = list(bundle['columns'])
+        self.encoder = OneHotEncoder(bundle['vocabulary'])
+        position = {name: k for k, name in enumerate(self.columns)}
+        # Encoder output column -> model column (-1 for values the model was not trained on)
+        self.encoded_positions = np.array([position.get(name, -1) for name in self.encoder.feature_names])
+        self.plain = [(k, name) for k, name in enumerate(self.columns) if name not in self.encoder.feature_names]
+        self.boroughs = zone_table(taxi_zones, 'Borough')
+
+    def borough_names(self, location_ids):
+        ids = np.nan_to_num(np.asarray(location_ids, dtype=float), nan=-1).astype(np.int64)
+        known = (ids >= 0) & (ids < len(self.boroughs))
+        return np.where(known, self.boroughs[np.where(known, ids, 0)], None)
+
+    # Feature matrix of raw trips (a DataFrame or the output of trip_columns), in bundle order
+    def features(self, trips):
+        frame = {col: np.asarray(trips[col], dtype=float) for col in NUMERIC_INPUTS}
+        pu_time = as_datetime(trips['tpep_pickup_datetime'])
+        do_time = as_datetime(trips['tpep_dropoff_datetime'])
+        frame.update(time_features(pu_time, do_time))
+        frame['PU_borough_name'] = self.borough_names(frame['PULocationID'])
+        frame['DO_borough_name'] = self.borough_names(frame['DOLocationID'])
+        frame['total_initial_fare'] = sum(frame[col] for col in FARE_COLUMNS)
+
+        X = np.zeros((len(pu_time), len(self.columns)))
+        rows, cols = self.encoder.positions(frame)
+        cols = self.encoded_positions[cols]
+        X[rows[cols >= 0], cols[cols >= 0]] = 1
+        for k, name in self.plain:
+            X[:, k] = np.asarray(frame[name], dtype=float)
+        return np.nan_to_num(X)
+
+    # Probability of a tip for every trip
+    def predict_proba(self, trips):
+        return self.model.predict_proba(self.scaler.transform(self.features(trips)))[:, 1]
+
+
+# Collects concurrent requests into micro-batches that are scored together
+class MicroBatcher:
+    def __init__(self, scorer, max_rows=2048, max_wait_ms=2.0):
+        self.scorer = scorer
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        # One scoring thread: batches run one after another, off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+
+    # Probabilities for one request's trips, given as trip_columns output of `rows` trips
+    async def score(self, columns, rows):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((columns, rows, future))
+        return await future
+
+    def _score_batch(self, requests):
+        return self.scorer.predict_proba(concat_columns([columns for columns, _, _ in requests]))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self.queue.get()]
+            rows = requests[0][1]
+            deadline = loop.time() + self.max_wait
+            while rows < self.max_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    requests.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                rows += requests[-1][1]
+            try:
+                probability = await loop.run_in_executor(self.executor, self._score_batch, requests)
+            except Exception as error:
+                for _, _, future in requests:
+                    future.set_exception(error)
+                continue
+            self.batches += 1
+            start = 0
+            for _, rows, future in requests:
+                future.set_result(probability[start:start + rows])
+                start += rows
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {'p50_ms': None, 'p99_ms': None}
+    p50, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 99])
+    return {'p50_ms': round(float(p50), 3), 'p99_ms': round(float(p99), 3)}
+
+
+# Minimal HTTP/1.1 server with keep-alive: POST /predict and GET /stats
+class TipService:
+    def __init__(self, batcher, threshold=0.5):
+        self.batcher = batcher
+        self.threshold = threshold
+        self.latencies = deque(maxlen=100000)
+        self.requests = 0
+        self.trips = 0
+        self.started = time.perf_counter()
+
+    def stats(self):
+        seconds = time.perf_counter() - self.started
+        return dict(percentiles(self.latencies), requests=self.requests, trips=self.trips,
+                    batches=self.batcher.batches, trips_per_second=round(self.trips / seconds, 1))
+
+    async def predict(self, body):
+        payload = json.loads(body)
+        trips = payload['trips'] if isinstance(payload, dict) else payload
+        if not trips:
+            return {'tip_probability': [], 'tip': []}
+        probability = await self.batcher.score(trip_columns(trips), len(trips))
+        return {'tip_probability': np.round(probability, 6).tolist(),
+                'tip': (probability >= self.threshold).astype(int).tolist()}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                start = time.perf_counter()
+                status = '200 OK'
+                method = path = body = None
+                try:
+                    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError(f'invalid Content-Length {length}')
+                    body = await reader.readexactly(length)
+                    start = time.perf_counter()
+                    if method == 'POST' and path == '/predict':
+                        result = await self.predict(body)
+                        self.requests += 1
+                        self.trips += len(result['tip'])
+                    elif method == 'GET' and path == '/stats':
+                        result = self.stats()
+                    else:
+                        status, result = '404 Not Found', {'error': f'no route {method} {path}'}
+                except (ValueError, KeyError, TypeError) as error:
+                    status, result = '400 Bad Request', {'error': str(error)}
+                response = json.dumps(result).encode()
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(response)}\r\n\r\n'.encode() + response)
+                await writer.drain()
+                if path == '/predict' and body is not None:
+                    self.latencies.append(time.perf_counter() - start)
+                # Without a valid request line and length the next request cannot be found
+                if body is None or headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def start_service(scorer, host='127.0.0.1', port=8060, max_rows=2048, max_wait_ms=2.0):
+    batcher = MicroBatcher(scorer, max_rows, max_wait_ms)
+    service = TipService(batcher)
+    batch_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(service.handle, host, port)
+    return server, service, batch_task
+
+
+# Send JSON over one keep-alive connection and read the response
+async def http_request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+    await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return json.loads(await reader.readexactly(length))
+
+
+# Fire requests of `trips_per_request` trips from `connections` concurrent clients
+async def run_load(host, port, trips, connections=32, requests=200, trips_per_request=8):
+    """Load generator: returns client-side p50/p99 latency and throughput."""
+    records = trips.astype(object).where(trips.notna(), None).to_dict('records')
+    latencies = []
+
+    async def client(seed):
+        rng = np.random.default_rng(seed)
+        reader, writer = await asyncio.open_connection(host, port)
+        for _ in range(requests):
+            batch = [records[i] for i in rng.integers(0, len(records), trips_per_request)]
+            start = time.perf_counter()
+            await http_request(reader, writer, 'POST', '/predict', {'trips': batch})
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(seed) for seed in range(connections)))
+    seconds = time.perf_counter() - start
+    total = connections * requests
+    return dict(percentiles(latencies), requests=total, seconds=round(seconds, 3),
+                requests_per_second=round(total / seconds, 1),
+                trips_per_second=round(total * trips_per_request / seconds, 1))
+
+
+def read_zones(path):
+    if os.path.exists(path):
+        return pd.read_csv(path)
+    from synthetic_data import make_taxi_zones
+    print(f'{path} not found, using synthetic zones')
+    return make_taxi_zones()
+
+
+async def serve(args):
+    scorer = TipScorer(load_bundle(args.model), read_zones(args.zones))
+    server, service, _ = await start_service(scorer, args.host, args.port, args.max_batch, args.max_wait_ms)
+    print(f'scoring on http://{args.host}:{args.port}/predict, stats on /stats')
+    async with server:
+        await server.serve_forever()
+
+
+def serve_process(args):
+    asyncio.run(serve(args))
+
+
+async def wait_for_port(host, port, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+# Start the service in a child process on a free port and drive it with the load generator,
+# so the clients do not compete with the server for the interpreter
+async def benchmark(args):
+    from synthetic_data import make_taxi_month
+    with socket.socket() as probe:
+        probe.bind((args.host, 0))
+        args.port = probe.getsockname()[1]
+    server = multiprocessing.Process(target=serve_process, args=(args,), daemon=True)
+    server.start()
+    try:
+        await wait_for_port(args.host, args.port)
+        trips = make_taxi_month(10000)
+        result = await run_load(args.host, args.port, trips, args.connections, args.requests, args.trips_per_request)
+        print(f"client: {result['requests']} requests in {result['seconds']} s  "
+              f"p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms  "
+              f"{result['requests_per_second']} req/s  {result['trips_per_second']} trips/s")
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+        print(f"server: {await http_request(reader, writer, 'GET', '/stats')}")
+        writer.close()
+    finally:
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve tip predictions over HTTP with request batching')
+    parser.add_argument('--model', required=True, help='bundle written by tip_training.py --out')
+    parser.add_argument('--zones', default='taxi+_zone_lookup.csv')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8060)
+    parser.add_argument('--max-batch', type=int, default=2048, help='most trips scored in one batch')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help='how long a batch waits to fill up')
+    parser.add_argument('--load', action='store_true', help='run the built-in load generator against a local instance')
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200, help='requests per connection')
+    parser.add_argument('--trips-per-request', type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args) if args.load else serve(args))
+
+
+if __name__ == '__main__':
+    main()
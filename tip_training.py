@@ -0,0 +1,156 @@
+import argparse
+import glob
+import os
+import pickle
+import time
+
+import numpy as np
+import pyarrow.parquet as pq
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import BernoulliNB
+from sklearn.preprocessing import MinMaxScaler
+
+from model_benchmark import NON_FEATURES, features_and_target, peak_rss_mb
+from parquet_reader import find_parts, iter_batches
+from taxi_pipeline import BOROUGH_VALUES, CATEGORY_VALUES
+
+CLASSES = np.array([0, 1])
+
+
+def make_online_model(name='sgd', seed=0):
+    if name == 'sgd':
+        return SGDClassifier(loss='log_loss', random_state=seed)
+    if name == 'nb':
+        return BernoulliNB()
+    raise ValueError(f'unknown model {name!r}, expected sgd or nb')
+
+
+# The month partitions under a prep output directory, or the path itself if it is one
+def month_partitions(path):
+    months = sorted(glob.glob(os.path.join(path, 'month=*')))
+    return months or [path]
+
+
+# Feature columns of a prepped partition, read from the Parquet schema alone
+def feature_columns(partition):
+    names = pq.ParquetFile(find_parts(partition)[0]).schema_arrow.names
+    return [name for name in names if name not in NON_FEATURES]
+
+
+# Stream (features, label) batches of the partitions, reading only the needed columns
+def iter_training_batches(partitions, columns, workers=None):
+    for partition in partitions:
+        for batch in iter_batches(partition, columns + ['tip_amount'], workers=workers):
+            features, target = features_and_target(batch.to_pandas())
+            yield features[columns].to_numpy(), target
+
+
+# Min/max of every column from the Parquet row group statistics, without reading any data
+def scaler_from_statistics(partitions, columns):
+    low = np.full(len(columns), np.inf)
+    high = np.full(len(columns), -np.inf)
+    for partition in partitions:
+        for part in find_parts(partition):
+            metadata = pq.ParquetFile(part).metadata
+            for index in range(metadata.num_row_groups):
+                row_group = metadata.row_group(index)
+                stats = {row_group.column(j).path_in_schema: row_group.column(j).statistics
+                         for j in range(row_group.num_columns)}
+                for k, column in enumerate(columns):
+                    if stats.get(column) is None or not stats[column].has_min_max:
+                        return None
+                    low[k] = min(low[k], float(stats[column].min))
+                    high[k] = max(high[k], float(stats[column].max))
+    scaler = MinMaxScaler()
+    scaler.partial_fit(np.vstack([low, high]))
+    return scaler
+
+
+# MinMaxScaler fitted batch by batch: from the statistics if every column has them, else in one pass
+def fit_streaming_scaler(partitions, columns, workers=None):
+    scaler = scaler_from_statistics(partitions, columns)
+    if scaler is None:
+        scaler = MinMaxScaler()
+        for features, _ in iter_training_batches(partitions, columns, workers):
+            scaler.partial_fit(features)
+    return scaler
+
+
+# Fit the scaler and an online classifier over the partitions without holding them in memory
+def train_streaming(partitions, model=None, workers=None):
+    """Train the tip classifier month by month with partial_fit.
+
+    Replaces the in-memory MinMaxScaler/fit of split_data: the scaler comes from the
+    Parquet min/max statistics (or a streaming pass when they are missing), then every
+    batch is scaled and fed to `model.partial_fit`. Only the row groups in flight are in
+    memory, so the peak stays flat however many months are trained on.
+    Returns (scaler, model, columns, stats).
+    """
+    model = model or make_online_model()
+    columns = feature_columns(partitions[0])
+    start = time.perf_counter()
+    scaler = fit_streaming_scaler(partitions, columns, workers)
+    rows = 0
+    for partition in partitions:
+        month_start, month_rows = time.perf_counter(), 0
+        for features, target in iter_training_batches([partition], columns, workers):
+            model.partial_fit(scaler.transform(features), target, classes=CLASSES)
+            month_rows += len(target)
+        seconds = time.perf_counter() - month_start
+        print(f'{os.path.basename(partition)}: {month_rows} rows  {month_rows / seconds:10.0f} rows/s  '
+              f'peak {peak_rss_mb():.0f} MB')
+        rows += month_rows
+    seconds = time.perf_counter() - start
+    stats = {'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds, 'peak_rss_mb': peak_rss_mb()}
+    return scaler, model, columns, stats
+
+
+# Accuracy and confusion counts on held-out partitions, streamed like the training data
+def evaluate_streaming(partitions, scaler, model, columns, workers=None):
+    confusion = np.zeros((2, 2), dtype=np.int64)
+    for features, target in iter_training_batches(partitions, columns, workers):
+        predicted = model.predict(scaler.transform(features))
+        np.add.at(confusion, (target, predicted), 1)
+    return {'accuracy': np.trace(confusion) / max(confusion.sum(), 1), 'confusion': confusion.tolist()}
+
+
+# Everything scoring needs: the fitted scaler and model, the feature order and the
+# one-hot vocabulary the training features were encoded with
+def save_bundle(path, scaler, model, columns):
+    bundle = {'scaler': scaler, 'model': model, 'columns': columns,
+              'vocabulary': dict(CATEGORY_VALUES, **BOROUGH_VALUES)}
+    with open(path, 'wb') as f:
+        pickle.dump(bundle, f)
+
+
+def load_bundle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the tip model incrementally on prepped Parquet months')
+    parser.add_argument('data', nargs='?', default='data-prep-yellow-2018')
+    parser.add_argument('--test-months', type=int, default=1, help='hold out the last N months for scoring')
+    parser.add_argument('--model', choices=['sgd', 'nb'], default='sgd')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default=None, help='save the model bundle for tip_service.py here')
+    args = parser.parse_args()
+
+    partitions = month_partitions(args.data)
+    if len(partitions) > args.test_months:
+        train, test = partitions[:len(partitions) - args.test_months], partitions[len(partitions) - args.test_months:]
+    else:
+        train, test = partitions, []
+    scaler, model, columns, stats = train_streaming(train, make_online_model(args.model), args.workers)
+    print(f"trained on {stats['rows']} rows in {stats['seconds']:.1f} s ({stats['rows_per_second']:.0f} rows/s), "
+          f"peak {stats['peak_rss_mb']:.0f} MB")
+    if test:
+        scores = evaluate_streaming(test, scaler, model, columns, args.workers)
+        print(f"accuracy on {len(test)} held-out months: {scores['accuracy']:.4f}  confusion {scores['confusion']}")
+    if args.out:
+        save_bundle(args.out, scaler, model, columns)
+
+
+if __name__ == '__main__':
+    main()
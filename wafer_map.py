@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+# Bin codes used by the dashboards: a passing die is 0, anything else is a failure (1)
+PASS_FAIL_BINS = {'P': 0, 'F': 1}
+
+
+# Build the die grid for one wafer in a single NumPy scatter
+def build_wafer_grid(df_selected, bin_column='pass_fail_flag', bin_codes=None, default_code=1, dtype=int):
+    """Turn the die rows of one lot/wafer selection into a (y, x) grid of bin codes.
+
+    NaN die coordinates are placed at 0 and coordinates are rounded, exactly like the
+    old iterrows loop. `bin_codes` maps the values of `bin_column` to integer codes
+    (P/F by default); values missing from the mapping get `default_code`. When a die
+    appears more than once the last row wins, as it did in the loop.
+    """
+    if bin_codes is None:
+        bin_codes = PASS_FAIL_BINS
+
+    # Replace NaN coordinates with 0 and round them to the nearest die
+    x = np.rint(df_selected['die_x'].fillna(0).to_numpy(dtype=float)).astype(np.intp)
+    y = np.rint(df_selected['die_y'].fillna(0).to_numpy(dtype=float)).astype(np.intp)
+
+    # Map every bin value to its code in one pass
+    codes = df_selected[bin_column].map(bin_codes).fillna(default_code).to_numpy().astype(dtype)
+
+    # Create a numpy array of zeros to represent the grid
+    grid = np.zeros((y.max() + 1, x.max() + 1), dtype=dtype)
+
+    # Keep only the last row for every die so repeated dies behave like the loop did
+    flat = y * grid.shape[1] + x
+    _, last = np.unique(flat[::-1], return_index=True)
+    keep = len(flat) - 1 - last
+
+    # Scatter the codes into the grid
+    grid[y[keep], x[keep]] = codes[keep]
+    return grid
+
+
+# Wafer number of every row (in order of first appearance) and the `keys` of every wafer
+def wafer_codes(df, keys=('lot_id', 'wafer_id')):
+    keys = list(keys)
+    # One integer per (lot, wafer): combine the codes of every key, then renumber them
+    combined = np.zeros(len(df), dtype=np.int64)
+    for key in keys:
+        codes, uniques = pd.factorize(df[key])
+        combined = combined * (len(uniques) + 1) + codes + 1
+    wafer = pd.factorize(combined)[0]
+    first = np.unique(wafer, return_index=True)[1]
+    return wafer, df[keys].iloc[first].reset_index(drop=True)
+
+
+# Build the die grids of many wafers at once, stacked into one (wafer, y, x) array
+def build_wafer_stack(df, keys=('lot_id', 'wafer_id'), bin_column='pass_fail_flag', bin_codes=None,
+                      default_code=1, dtype=np.uint8):
+    """Batch version of build_wafer_grid for every wafer in `df`.
+
+    Returns (wafers, grids, tested): a frame with the `keys` of every wafer in order of
+    first appearance, the (n_wafers, y, x) stack of bin codes, and a boolean stack of
+    the dies that have a row. All grids share the shape of the largest coordinates in
+    `df`. Coordinates and repeated dies are handled like build_wafer_grid.
+    """
+    if bin_codes is None:
+        bin_codes = PASS_FAIL_BINS
+    wafer, wafers = wafer_codes(df, keys)
+
+    x = np.rint(df['die_x'].astype(float).fillna(0).to_numpy(dtype=float)).astype(np.intp)
+    y = np.rint(df['die_y'].astype(float).fillna(0).to_numpy(dtype=float)).astype(np.intp)
+    codes = df[bin_column].map(bin_codes).astype(float).fillna(default_code).to_numpy().astype(dtype)
+
+    shape = (len(wafers), int(y.max(initial=0)) + 1, int(x.max(initial=0)) + 1)
+    grids = np.zeros(shape, dtype=dtype)
+    tested = np.zeros(shape, dtype=bool)
+    flat = (wafer * shape[1] + y) * shape[2] + x
+    _, last = np.unique(flat[::-1], return_index=True)
+    keep = len(flat) - 1 - last
+    grids.reshape(-1)[flat[keep]] = codes[keep]
+    tested.reshape(-1)[flat] = True
+    return wafers, grids, tested
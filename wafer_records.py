@@ -0,0 +1,335 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from aoi_loader import AOI_COLUMNS, load_aoi, read_aoi_cache, write_aoi_cache
+from wafer_map import wafer_codes
+
+# Arrays of a record set, one .npy file each in the record directory
+RECORD_ARRAYS = ['lot', 'wafer', 'tester', 'start', 'height', 'width', 'plane_start', 'fails', 'mask', 'masks',
+                 'mask_start', 'fail_start', 'descriptions', 'time_start', 'seconds']
+# Rows the planes cannot hold, kept as they are
+EXCEPTIONS_FILE = 'exceptions.arrow'
+META_FILE = 'meta.json'
+
+
+# Pack many wafers' (y, x) bits into one byte string, every wafer starting on a byte boundary
+def _pack_bits(bits_at, total_bytes):
+    bits = np.zeros(total_bytes * 8, dtype=bool)
+    bits[bits_at] = True
+    return np.packbits(bits)
+
+
+# Category codes of failing dies in the smallest unsigned type; a missing value (code -1)
+# is stored as `count`, the code after the last category
+def _store_codes(codes, count):
+    codes = np.where(codes < 0, count, codes)
+    return codes.astype(np.uint8 if count < 2**8 else np.uint16 if count < 2**16 else np.uint32)
+
+
+# Per-wafer die records of the AOI rows: bit-packed pass/fail planes instead of one row per die
+class WaferRecords:
+    """Every wafer is stored as its grid size, one bit per die for pass/fail, the
+    description code of its failing dies only, and the lot, wafer, tester and test time
+    once. The planes of all wafers are concatenated into a few flat arrays with an
+    offset per wafer, so one wafer decodes with a single np.unpackbits.
+
+    The tested-die outline is usually the same for every wafer of a product, so each
+    distinct outline is stored once. Dies whose test times differ within a wafer keep
+    their seconds since the wafer's first test. A failing die without a description
+    keeps a code of its own after the last description.
+
+    Rows the planes cannot express (missing or negative coordinates, repeated dies,
+    flags other than P/F, a tester or time unlike the rest of the wafer, passing dies
+    with an unusual description) are kept as an exception table, so to_frame() gives
+    back the same rows, grouped by wafer instead of in file order.
+    """
+
+    def __init__(self, arrays, meta, exceptions):
+        self.arrays = arrays
+        self.meta = meta
+        self.exceptions = exceptions
+        lots, wafers = meta['categories']['lot_id'], meta['categories']['wafer_id']
+        self.index = {(lots[lot], wafers[wafer]): i
+                      for i, (lot, wafer) in enumerate(zip(arrays['lot'].tolist(), arrays['wafer'].tolist()))}
+        self.exception_start = np.searchsorted(exceptions['wafer'].to_numpy(), np.arange(len(self) + 1))
+
+    def __len__(self):
+        return len(self.arrays['lot'])
+
+    # Encode AOI rows as read by aoi_loader (any column order, categorical or plain columns)
+    @classmethod
+    def from_frame(cls, df):
+        df = df[AOI_COLUMNS].reset_index(drop=True)
+        categories = {col: df[col].astype('category').cat.categories
+                      for col in ['lot_id', 'wafer_id', 'tester_id', 'description', 'pass_fail_flag']}
+        wafer, keys = wafer_codes(df)
+        n = len(keys)
+
+        x = df['die_x'].astype(float).to_numpy(dtype=float, na_value=np.nan)
+        y = df['die_y'].astype(float).to_numpy(dtype=float, na_value=np.nan)
+        placed = (x >= 0) & (y >= 0)
+        x = np.rint(np.where(placed, x, 0)).astype(np.int64)
+        y = np.rint(np.where(placed, y, 0)).astype(np.int64)
+        height = np.ones(n, dtype=np.int64)
+        width = np.ones(n, dtype=np.int64)
+        np.maximum.at(height, wafer[placed], y[placed] + 1)
+        np.maximum.at(width, wafer[placed], x[placed] + 1)
+        plane_bytes = -(-height * width // 8)
+        plane_start = np.concatenate([[0], np.cumsum(plane_bytes)])
+
+        # The last row of every placed die goes into the planes (the last one wins, as in
+        # build_wafer_grid), in wafer then row-major order
+        bit = plane_start[wafer] * 8 + y * width[wafer] + x
+        rows = np.flatnonzero(placed)
+        _, last = np.unique(bit[rows][::-1], return_index=True)
+        kept = rows[len(rows) - 1 - last]
+        kept_wafer, kept_bit = wafer[kept], bit[kept]
+
+        flag = df['pass_fail_flag'].astype(object).to_numpy()[kept]
+        failing = flag != 'P'
+        description = pd.Categorical(df['description'], categories=categories['description']).codes[kept]
+        pass_description = pd.Series(description[~failing]).mode()
+        pass_description = int(pass_description.iloc[0]) if len(pass_description) else -1
+        # Tester of the first die and earliest test time of every wafer
+        tester = np.full(n, -1, dtype=np.int32)
+        wafers_kept, first = np.unique(kept_wafer, return_index=True)
+        kept_tester = pd.Categorical(df['tester_id'], categories=categories['tester_id']).codes[kept]
+        tester[wafers_kept] = kept_tester[first]
+        times = df['test_date_time'].astype('datetime64[ns]').to_numpy()[kept]
+        start = np.full(n, np.datetime64('NaT'), dtype='datetime64[ns]')
+        earliest = pd.Series(times).groupby(kept_wafer).min()
+        start[earliest.index.to_numpy()] = earliest.to_numpy()
+        seconds = (times - start[kept_wafer]).astype(np.int64)
+
+        # Placed dies the planes hold only partly: their rows go to the exceptions as well
+        override = ((flag != 'P') & (flag != 'F')) | (kept_tester != tester[kept_wafer]) | np.isnat(times)
+        override |= (seconds % 10**9 != 0) | (seconds >= 2**32 * 10**9)
+        override |= ~failing & (description != pass_description)
+        seconds = np.where(override, 0, seconds // 10**9).astype(np.uint32)
+
+        # Wafers with more than one test time keep the seconds of every tested die
+        varying = np.zeros(n, dtype=bool)
+        varying[kept_wafer[seconds > 0]] = True
+        time_count = np.bincount(kept_wafer[varying[kept_wafer]], minlength=n)
+        fail_count = np.bincount(kept_wafer[failing], minlength=n)
+
+        tested = _pack_bits(kept_bit, plane_start[-1])
+        fails = _pack_bits(kept_bit[failing], plane_start[-1])
+        # One copy of every distinct tested outline
+        outlines, mask = {}, np.zeros(n, dtype=np.int32)
+        for i in range(n):
+            key = (height[i], width[i], tested[plane_start[i]:plane_start[i + 1]].tobytes())
+            mask[i] = outlines.setdefault(key, len(outlines))
+        masks = [np.frombuffer(key[2], dtype=np.uint8) for key in outlines]
+
+        extra = np.ones(len(df), dtype=bool)
+        extra[kept] = False
+        exception_rows = np.concatenate([np.flatnonzero(extra), kept[override]])
+        exception_rows = exception_rows[np.argsort(wafer[exception_rows], kind='stable')]
+        exceptions = df.iloc[exception_rows].reset_index(drop=True)
+        exceptions['wafer'] = wafer[exception_rows].astype(np.int32)
+        exceptions['placed'] = ~extra[exception_rows]
+
+        lot_codes = pd.Categorical(keys['lot_id'], categories=categories['lot_id']).codes
+        wafer_id_codes = pd.Categorical(keys['wafer_id'], categories=categories['wafer_id']).codes
+        arrays = {
+            'lot': lot_codes.astype(np.int32), 'wafer': wafer_id_codes.astype(np.int32),
+            'tester': tester, 'start': start.astype(np.int64),
+            'height': height.astype(np.uint16), 'width': width.astype(np.uint16),
+            'plane_start': plane_start, 'fails': fails, 'mask': mask,
+            'masks': np.concatenate(masks) if masks else np.zeros(0, dtype=np.uint8),
+            'mask_start': np.concatenate([[0], np.cumsum([len(m) for m in masks], dtype=np.int64)]),
+            'fail_start': np.concatenate([[0], np.cumsum(fail_count)]),
+            'descriptions': _store_codes(description[failing], len(categories['description'])),
+            'time_start': np.concatenate([[0], np.cumsum(time_count)]),
+            'seconds': seconds[varying[kept_wafer]],
+        }
+        meta = {'categories': {col: values.tolist() for col, values in categories.items()},
+                'pass_description': pass_description,
+                'time_unit': np.datetime_data(df['test_date_time'].dtype)[0]}
+        return cls(arrays, meta, exceptions)
+
+    # Write the records as a directory of .npy files, the category names and the exceptions
+    def save(self, path):
+        tmp_path = path.rstrip('/') + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in RECORD_ARRAYS:
+            np.save(os.path.join(tmp_path, name + '.npy'), self.arrays[name])
+        with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+            json.dump(self.meta, f)
+        write_aoi_cache(self.exceptions, os.path.join(tmp_path, EXCEPTIONS_FILE))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    # Memory-map a saved record directory; only the pages of the wafers read are loaded
+    @classmethod
+    def load(cls, path, mmap=True):
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None)
+                  for name in RECORD_ARRAYS}
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        return cls(arrays, meta, read_aoi_cache(os.path.join(path, EXCEPTIONS_FILE)))
+
+    # Bytes of the arrays and the exception table
+    @property
+    def nbytes(self):
+        return (sum(array.nbytes for array in self.arrays.values())
+                + int(self.exceptions.memory_usage(deep=True).sum()))
+
+    def lot_ids(self):
+        return sorted({lot_id for lot_id, _ in self.index})
+
+    def wafer_ids(self, lot_id):
+        return sorted(wafer_id for lot, wafer_id in self.index if lot == lot_id)
+
+    def _position(self, lot_id, wafer_id):
+        if (lot_id, wafer_id) not in self.index:
+            raise KeyError(f'no wafer {wafer_id} in lot {lot_id}')
+        return self.index[(lot_id, wafer_id)]
+
+    # Stored description codes back to category codes, -1 for a missing description
+    def _description_codes(self, stored):
+        codes = np.asarray(stored).astype(np.int64)
+        codes[codes == len(self.meta['categories']['description'])] = -1
+        return codes
+
+    # Unpack the (height, width) bits of wafer i from a slice of packed bytes
+    def _unpack(self, packed, i):
+        height, width = int(self.arrays['height'][i]), int(self.arrays['width'][i])
+        return np.unpackbits(packed, count=height * width).reshape(height, width)
+
+    def _slice(self, name, start, i):
+        return self.arrays[name][int(self.arrays[start][i]):int(self.arrays[start][i + 1])]
+
+    # Pass/fail grid of a wafer (0 pass or untested, 1 fail), the same as build_wafer_grid of its rows
+    def grid(self, lot_id, wafer_id):
+        i = self._position(lot_id, wafer_id)
+        grid = self._unpack(self._slice('fails', 'plane_start', i), i)
+        # Like build_wafer_grid, rows without coordinates land on die (0, 0)
+        if self.exception_start[i + 1] > self.exception_start[i]:
+            extra = self.exceptions.iloc[self.exception_start[i]:self.exception_start[i + 1]]
+            extra = extra[~extra['placed'] & (extra['die_x'].isna() | extra['die_y'].isna())]
+            if len(extra):
+                grid[0, 0] = extra['pass_fail_flag'].iloc[-1] != 'P'
+        return grid
+
+    # Dies of a wafer that have a row
+    def tested(self, lot_id, wafer_id):
+        i = self._position(lot_id, wafer_id)
+        return self._unpack(self._slice('masks', 'mask_start', int(self.arrays['mask'][i])), i).astype(bool)
+
+    # Coordinates and descriptions of the failing dies of a wafer, in row-major order
+    def failing_dies(self, lot_id, wafer_id):
+        i = self._position(lot_id, wafer_id)
+        die_y, die_x = np.nonzero(self._unpack(self._slice('fails', 'plane_start', i), i))
+        codes = self._description_codes(self._slice('descriptions', 'fail_start', i))
+        return pd.DataFrame({'die_x': die_x, 'die_y': die_y, 'description': pd.Categorical.from_codes(
+            codes, categories=self.meta['categories']['description'])})
+
+    # The row table back, wafer by wafer with the exception rows of all wafers at the end
+    def to_frame(self):
+        """Vectorized over all wafers: the tested outlines are gathered into one plane
+        laid out like the pass/fail planes, and every set bit becomes a row."""
+        arrays, categories = self.arrays, self.meta['categories']
+        height, width = arrays['height'].astype(np.int64), arrays['width'].astype(np.int64)
+        plane_start, mask_start = arrays['plane_start'], arrays['mask_start']
+        mask = arrays['mask']
+        tested = np.concatenate([np.zeros(0, dtype=np.uint8)] + [
+            arrays['masks'][mask_start[m]:mask_start[m + 1]] for m in mask.tolist()])
+        tested = np.flatnonzero(np.unpackbits(tested))
+        failing = np.unpackbits(np.asarray(arrays['fails']))[tested].astype(bool)
+        wafer = np.searchsorted(plane_start * 8, tested, side='right') - 1
+        local = tested - plane_start[wafer] * 8
+        die_y, die_x = local // width[wafer], local % width[wafer]
+
+        description = np.full(len(tested), self.meta['pass_description'], dtype=np.int64)
+        description[failing] = self._description_codes(arrays['descriptions'])
+        seconds = np.zeros(len(tested), dtype=np.int64)
+        time_count = np.diff(arrays['time_start'])
+        seconds[time_count[wafer] > 0] = arrays['seconds']
+        times = (np.asarray(arrays['start'])[wafer] + seconds * 10**9).astype('datetime64[ns]')
+
+        def category(col, codes):
+            return pd.Categorical.from_codes(codes, categories=categories[col])
+
+        df = pd.DataFrame({
+            'lot_id': category('lot_id', arrays['lot'][wafer]),
+            'wafer_id': category('wafer_id', arrays['wafer'][wafer]),
+            'die_x': pd.array(die_x, dtype='Int16'), 'die_y': pd.array(die_y, dtype='Int16'),
+            'pass_fail_flag': category('pass_fail_flag', np.where(
+                failing, categories['pass_fail_flag'].index('F') if 'F' in categories['pass_fail_flag'] else -1,
+                categories['pass_fail_flag'].index('P') if 'P' in categories['pass_fail_flag'] else -1)),
+            'description': category('description', description),
+            'test_date_time': times.astype(f"datetime64[{self.meta['time_unit']}]"),
+            'tester_id': category('tester_id', arrays['tester'][wafer]),
+        })
+        # Dies the exceptions hold in full are replaced by their rows
+        exceptions = self.exceptions
+        placed = exceptions[exceptions['placed']]
+        if len(placed):
+            ex_wafer = placed['wafer'].to_numpy()
+            ex_x = np.rint(placed['die_x'].astype(float).to_numpy(dtype=float)).astype(np.int64)
+            ex_y = np.rint(placed['die_y'].astype(float).to_numpy(dtype=float)).astype(np.int64)
+            ex_bit = plane_start[ex_wafer] * 8 + ex_y * width[ex_wafer] + ex_x
+            df = df.drop(index=np.searchsorted(tested, ex_bit))
+        rows = exceptions[AOI_COLUMNS].astype({col: df[col].dtype for col in AOI_COLUMNS})
+        return pd.concat([df, rows], ignore_index=True)
+
+
+# Whether two row tables hold the same rows, in any order (missing values compare equal)
+def same_rows(a, b):
+    if len(a) != len(b):
+        return False
+
+    def canonical(frame):
+        frame = frame[AOI_COLUMNS].astype({'die_x': float, 'die_y': float}).astype(object)
+        return frame.where(frame.notna(), None).astype(str).sort_values(AOI_COLUMNS).reset_index(drop=True)
+    return canonical(a).equals(canonical(b))
+
+
+# Size of a file or of all files below a directory
+def disk_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert the AOI export to per-wafer die records and back')
+    parser.add_argument('csv', help='AOI CSV export (its .arrow cache is used when fresh)')
+    parser.add_argument('records', help='record directory to write')
+    parser.add_argument('--export', help='also write the rows decoded from the records to this CSV')
+    parser.add_argument('--check', action='store_true', help='check that the saved records decode to the same rows')
+    args = parser.parse_args()
+
+    df = load_aoi(args.csv)
+    start = time.perf_counter()
+    records = WaferRecords.from_frame(df)
+    records.save(args.records)
+    print(f'encoded {len(df)} rows of {len(records)} wafers in {time.perf_counter() - start:.2f} s '
+          f'({len(records.exceptions)} exception rows)')
+    frame_bytes = df.memory_usage(deep=True).sum()
+    print(f'memory: {frame_bytes / 2**20:.1f} MB as rows, {records.nbytes / 2**20:.2f} MB as records '
+          f'({frame_bytes / records.nbytes:.0f}x)')
+    csv_bytes, record_bytes = disk_bytes(args.csv), disk_bytes(args.records)
+    print(f'disk: {csv_bytes / 2**20:.1f} MB CSV, {record_bytes / 2**20:.2f} MB records '
+          f'({csv_bytes / record_bytes:.0f}x)')
+    if args.export or args.check:
+        rows = WaferRecords.load(args.records).to_frame()
+        if args.export:
+            rows.to_csv(args.export, index=False)
+        if args.check:
+            if not same_rows(df, rows):
+                raise SystemExit('round trip check failed: the records do not decode to the same rows')
+            print('round trip check passed')
+
+
+if __name__ == '__main__':
+    main()